@@ -3,10 +3,12 @@ from flask import Flask
 from dotenv import load_dotenv
 load_dotenv()
 from router import router_bp
+import db
 import src.utils as utils
 
 app = Flask(__name__)
 app.register_blueprint(router_bp)
+db.init_app(app)
 
 app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
 
@@ -20,10 +22,12 @@ def method_not_allowed_error(error):
 
 @app.errorhandler(500)
 def internal_error(error):
+    db.rollback_request()
     return utils.ResultDTO(code=500, message="서버 내부 오류가 발생했습니다.", result=False).to_response()
 
 @app.errorhandler(Exception)
 def unhandled_exception(error):
+    db.rollback_request()
     return utils.ResultDTO(code=500, message=f"오류가 발생했습니다: {str(error)}", result=False).to_response()
 
 if __name__ == '__main__':
@@ -1,112 +1,129 @@
+import os
 import sqlite3
+from flask import g, has_request_context, make_response
+from db.pool import ConnectionPool
+from db.migrations import migrate
+import src.utils as utils
+
+DB_PATH = 'db/main.db'
+
+pool = ConnectionPool(
+    DB_PATH,
+    max_idle=int(os.environ.get('DB_POOL_SIZE', 8)),
+    cached_statements=int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 256)),
+    cache_size_kb=int(os.environ.get('DB_CACHE_SIZE_KB', 16384)),
+    mmap_size=int(os.environ.get('DB_MMAP_SIZE', 128 * 1024 * 1024)),
+    busy_timeout_ms=int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+)
+
+class RequestConnection:
+    # 요청 단위로 공유되는 연결
+    # 중간의 commit()/close()는 무시하고, 요청이 끝날 때 한 번만 커밋(또는 롤백)
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def execute(self, *args):
+        return self.conn.execute(*args)
+
+    def executemany(self, *args):
+        return self.conn.executemany(*args)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.conn.rollback()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.conn.in_transaction
 
 def get_db_connection():
-    conn = sqlite3.connect('db/main.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    if has_request_context():
+        scoped = g.get('db_conn')
+        if scoped is None:
+            scoped = g.db_conn = RequestConnection(pool.acquire())
+        return scoped
+    return pool.acquire()
 
 def close_db_connection(conn):
-    if conn:
-        conn.close()
-        
+    if conn and not isinstance(conn, RequestConnection):
+        pool.release(conn)
+
+def on_commit(callback):
+    # 요청 트랜잭션이 커밋된 뒤 실행. 요청 밖에서는 즉시 실행
+    if has_request_context():
+        g.setdefault('db_on_commit', []).append(callback)
+        return
+    callback()
+
+def rollback_request():
+    # 에러 핸들러에서 호출. 요청 종료 시 커밋하지 않고 롤백
+    if has_request_context():
+        g.db_rollback = True
+
+def _commit_request() -> bool:
+    scoped = g.get('db_conn')
+    if g.get('db_rollback'):
+        if scoped is not None:
+            scoped.conn.rollback()
+        g.pop('db_on_commit', None)
+        return True
+    if scoped is not None and scoped.conn.in_transaction:
+        try:
+            scoped.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Failed to commit request transaction: {e}")
+            scoped.conn.rollback()
+            g.pop('db_on_commit', None)
+            return False
+    for callback in g.pop('db_on_commit', []):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Failed to run on_commit callback: {e}")
+    return True
+
+def release_request_connection() -> bool:
+    # 요청 중 오래 대기하기 전에 호출. 지금까지의 변경을 커밋하고 연결을 풀에 반환
+    # 이후 get_db_connection을 호출하면 새 연결을 사용
+    if not has_request_context():
+        return True
+    committed = _commit_request()
+    scoped = g.pop('db_conn', None)
+    if scoped is not None:
+        pool.release(scoped.conn)
+    return committed
+
+def init_app(app):
+    @app.after_request
+    def commit_request(response):
+        # 응답 전에 커밋해야 커밋 실패를 클라이언트에 알릴 수 있음
+        # 오류를 잡아 5xx 결과로 반환한 경우에도 그 전까지의 일부 변경은 반영하지 않음
+        if response.status_code >= 500:
+            rollback_request()
+        if not _commit_request():
+            return make_response(utils.ResultDTO(code=500, message="데이터 저장 중 오류가 발생했습니다.", result=False).to_response())
+        return response
+
+    @app.teardown_request
+    def teardown_request_connection(error):
+        # 스트리밍 응답 등 after_request 이후의 변경사항 정리
+        if error is not None:
+            g.db_rollback = True
+        release_request_connection()
+
+def get_pool_stats() -> dict:
+    return pool.stats()
+
 def init_db():
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.executescript('''
-        CREATE TABLE IF NOT EXISTS email_verification (
-            email TEXT PRIMARY KEY,
-            verification_code TEXT NOT NULL,
-            is_verified BOOLEAN NOT NULL DEFAULT 0,
-            try_count INTEGER NOT NULL DEFAULT 0,
-            updated_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours'))
-        );
-        
-        CREATE TABLE IF NOT EXISTS users (
-            uid TEXT PRIMARY KEY,
-            email TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            salt TEXT NOT NULL,
-            name TEXT NOT NULL,
-            profile_url TEXT DEFAULT NULL,
-            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            FOREIGN KEY (email) REFERENCES email_verification(email)
-        );
-        
-        CREATE TABLE IF NOT EXISTS user_password_find_link (
-            email TEXT NOT NULL,
-            link_hash TEXT NOT NULL,
-            is_used BOOLEAN NOT NULL DEFAULT FALSE,
-            is_active BOOLEAN NOT NULL DEFAULT TRUE,
-            update_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            
-            FOREIGN KEY (email) REFERENCES email_verification(email)
-        );
-
-        CREATE TABLE IF NOT EXISTS user_sessions (
-            sid TEXT PRIMARY KEY,
-            uid TEXT NOT NULL,
-            user_agent TEXT NOT NULL,
-            ip_address TEXT NOT NULL,
-            is_active BOOLEAN NOT NULL DEFAULT 1,
-            last_accessed TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            update_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            expires_at TIMESTAMP NOT NULL,
-            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            FOREIGN KEY (uid) REFERENCES users(uid)
-        );
-        
-        CREATE TABLE IF NOT EXISTS user_session_deactive_link (
-            sid TEXT PRIMARY KEY,
-            link_hash TEXT NOT NULL,
-            is_used BOOLEAN NOT NULL DEFAULT FALSE,
-            update_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-
-            FOREIGN KEY (sid) REFERENCES user_sessions(sid)
-        );
-
-        CREATE TABLE IF NOT EXISTS foods (
-            fid TEXT PRIMARY KEY,
-            uid TEXT NOT NULL,
-            is_active BOOLEAN NOT NULL DEFAULT 1,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL,
-            ingredients TEXT DEFAULT '정보없음',
-            description TEXT NOT NULL,
-            count INTEGER NOT NULL DEFAULT 0,
-            volume TEXT DEFAULT NULL,
-            image_url TEXT DEFAULT NULL,
-            barcode TEXT NOT NULL,
-            expiration_date_desc TEXT,
-            expiration_date DATE NOT NULL,
-            updated_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            FOREIGN KEY (uid) REFERENCES users(uid)
-        );
-
-        CREATE TABLE IF NOT EXISTS food_chat (
-            fcid TEXT PRIMARY KEY,
-            uid TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'created',
-            response TEXT DEFAULT NULL,
-            usage_input_token INTEGER NOT NULL DEFAULT 0,
-            usage_output_token INTEGER NOT NULL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            updated_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-            FOREIGN KEY (uid) REFERENCES users(uid)
-        );
-        CREATE TABLE IF NOT EXISTS food_chat_items (
-            fcid TEXT NOT NULL,
-            fid TEXT NOT NULL,
-            FOREIGN KEY (fcid) REFERENCES food_chat(fcid),
-            FOREIGN KEY (fid) REFERENCES foods(fid),
-            PRIMARY KEY (fcid, fid)
-        )
-    ''')
-    
-    conn.commit()
-    close_db_connection(conn)
+    try:
+        migrate(conn)
+    finally:
+        close_db_connection(conn)
     
 init_db()
\ No newline at end of file
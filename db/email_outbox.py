@@ -0,0 +1,86 @@
+import db
+
+# 메일 발송 대기열(outbox). 요청에서는 INSERT만 하고, 실제 전송은 src.email의 워커가 담당
+# lease 연장, 반환, 만료 복구는 db.lease_queue.LeaseQueue에서 처리
+# status: queued(대기) -> sending(워커가 lease를 가지고 전송 중) -> 성공 시 삭제, 실패 시 queued(재시도) 또는 dead
+
+def enqueue(receiver_email: str, subject: str, plain: str, html: str, priority: int) -> int:
+    # 요청 중에는 요청 트랜잭션과 함께 커밋되므로, 요청이 롤백되면 메일도 보내지 않음
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO email_outbox (receiver_email, subject, plain, html, priority) VALUES (?, ?, ?, ?, ?)",
+                   (receiver_email, subject, plain, html, priority))
+    eid = cursor.lastrowid
+    conn.commit()
+    db.close_db_connection(conn)
+    return eid
+
+def claim(lease_owner: str, lease_seconds: float, limit: int) -> list:
+    # 보낼 시간이 된 메일을 우선순위 순서로 limit개까지 한 번의 UPDATE로 가져감
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""UPDATE email_outbox SET status = 'sending', lease_owner = ?, lease_expires_at = datetime('now', '+9 hours', ?),
+                       attempts = attempts + 1, updated_at = datetime('now', '+9 hours')
+                       WHERE eid IN (SELECT eid FROM email_outbox WHERE status = 'queued' AND next_attempt_at <= datetime('now', '+9 hours')
+                                     ORDER BY priority, next_attempt_at LIMIT ?)
+                       RETURNING eid, receiver_email, subject, plain, html, priority, attempts,
+                       (julianday('now', '+9 hours') - julianday(created_at)) * 86400000 AS wait_ms""",
+                       (lease_owner, f"+{lease_seconds} seconds", limit))
+        rows = cursor.fetchall()
+        conn.commit()
+    finally:
+        db.close_db_connection(conn)
+    # RETURNING은 순서를 보장하지 않으므로 우선순위, 등록 순서로 정렬
+    return sorted((dict(row) for row in rows), key=lambda row: (row['priority'], row['eid']))
+
+def mark_sent(eid: int, lease_owner: str) -> bool:
+    # 전송한 메일은 outbox에서 삭제. lease가 만료되어 다른 워커가 가져갔다면 False
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM email_outbox WHERE eid = ? AND lease_owner = ?", (eid, lease_owner))
+        deleted = cursor.rowcount > 0
+        conn.commit()
+    finally:
+        db.close_db_connection(conn)
+    return deleted
+
+def mark_failed(eid: int, lease_owner: str, error: str, retry_delay: float, max_attempts: int, permanent: bool = False) -> str | None:
+    # 재시도 횟수가 남았으면 retry_delay초 뒤에 다시 보내도록 queued, 아니면 dead. 변경된 상태 반환
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""UPDATE email_outbox SET status = CASE WHEN ? OR attempts >= ? THEN 'dead' ELSE 'queued' END,
+                       next_attempt_at = datetime('now', '+9 hours', ?), lease_owner = NULL, lease_expires_at = NULL,
+                       last_error = ?, updated_at = datetime('now', '+9 hours')
+                       WHERE eid = ? AND lease_owner = ? RETURNING status""",
+                       (permanent, max_attempts, f"+{retry_delay} seconds", error[:1000], eid, lease_owner))
+        row = cursor.fetchone()
+        conn.commit()
+    finally:
+        db.close_db_connection(conn)
+    return row['status'] if row else None
+
+def has_queued_before(priority: int) -> bool:
+    # priority보다 우선순위가 높은 메일 중 지금 보낼 수 있는 메일이 있는지
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM email_outbox WHERE status = 'queued' AND priority < ? AND next_attempt_at <= datetime('now', '+9 hours') LIMIT 1", (priority,))
+    row = cursor.fetchone()
+    db.close_db_connection(conn)
+    return row is not None
+
+def get_queue_depth() -> dict:
+    # {상태: {우선순위: 개수}}
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    # 상태별로 인덱스 범위를 좁혀서 셈(전체 스캔 방지)
+    cursor.execute("SELECT status, priority, COUNT(*) AS count FROM email_outbox WHERE status IN ('queued', 'sending', 'dead') GROUP BY status, priority")
+    rows = cursor.fetchall()
+    db.close_db_connection(conn)
+
+    depth = {}
+    for row in rows:
+        depth.setdefault(row['status'], {})[row['priority']] = row['count']
+    return depth
@@ -1,23 +1,14 @@
-import json
-import os
+import base64
 import db
-import db.session
+import db.product
 import src.utils as utils
-import requests
-from datetime import datetime, timedelta
+import src.ingredients
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 load_dotenv()
-# import urllib3
-# urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def delete_food(sid: str, fid: str) -> utils.ResultDTO:
-    session_info = db.session.get_info(sid)
-    if not session_info.result:
-        return session_info
-    
-    uid = session_info.data['session_info']['uid']
-    
-    food_info = get_info(sid, fid)
+def delete_food(uid: str, fid: str) -> utils.ResultDTO:
+    food_info = get_info(uid, fid)
     if not food_info.result:
         return food_info
     
@@ -35,13 +26,7 @@ def delete_food(sid: str, fid: str) -> utils.ResultDTO:
     db.close_db_connection(conn)
     return utils.ResultDTO(code=200, message="성공적으로 삭제되었습니다.", result=True)
 
-def get_info(sid: str, fid: str) -> utils.ResultDTO:
-    session_info = db.session.get_info(sid)
-    if not session_info.result:
-        return session_info
-    if session_info.data['session_info']['is_active'] == 0:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
-
+def get_info(uid: str, fid: str) -> utils.ResultDTO:
     if not fid:
         return utils.ResultDTO(code=400, message="유효하지 않은 식품 ID입니다.", result=False)
     
@@ -49,7 +34,6 @@ def get_info(sid: str, fid: str) -> utils.ResultDTO:
     cursor = conn.cursor()
 
     # 유저 ID와 식품 ID가 일치하는 식품 정보 조회
-    uid = session_info.data['session_info']['uid']
     cursor.execute("SELECT * FROM foods WHERE fid = ? AND uid = ?", (fid, uid))
     row = cursor.fetchone()
     
@@ -57,6 +41,7 @@ def get_info(sid: str, fid: str) -> utils.ResultDTO:
         cursor.execute("SELECT * FROM foods WHERE fid = ?", (fid,))
         row = cursor.fetchone()
         if row:
+            db.close_db_connection(conn)
             return utils.ResultDTO(code=401, message="본인의 식품 정보만 조회할 수 있습니다.", result=False)
         
         db.close_db_connection(conn)
@@ -72,106 +57,290 @@ def get_info(sid: str, fid: str) -> utils.ResultDTO:
     db.close_db_connection(conn)
     return utils.ResultDTO(code=200, message="성공적으로 조회되었습니다.", data={'food_info': row}, result=True)
 
-def get_list_info(sid: str) -> utils.ResultDTO:
-    session_info = db.session.get_info(sid)
-    # 잘못된 세션 ID일 경우 실패 처리
-    if not session_info.result:
-        return session_info
-    if session_info.data['session_info']['is_active'] == 0:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
+def get_many(uid: str, fids: list) -> utils.ResultDTO:
+    # 여러 식품 정보를 한 번의 쿼리로 조회. 식품별 결과(code, message)는 get_info와 같은 기준
+    results = [{'index': index, 'fid': fid, 'result': False} for index, fid in enumerate(fids)]
+    
+    valid_fids = list(dict.fromkeys(fid for fid in fids if fid))
+    rows = {}
+    if valid_fids:
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        
+        placeholders = ', '.join('?' * len(valid_fids))
+        cursor.execute(f"SELECT * FROM foods WHERE fid IN ({placeholders})", valid_fids)
+        rows = {row['fid']: row for row in cursor.fetchall()}
+        
+        db.close_db_connection(conn)
     
-    uid = session_info.data['session_info']['uid']
+    current_date = datetime.now()
+    for result in results:
+        row = rows.get(result['fid'])
+        if not result['fid']:
+            result.update(code=400, message="유효하지 않은 식품 ID입니다.")
+        elif not row:
+            result.update(code=404, message="등록된 식품 정보를 찾을 수 없습니다.")
+        elif row['uid'] != uid:
+            result.update(code=401, message="본인의 식품 정보만 조회할 수 있습니다.")
+        else:
+            food_info = dict(row)
+            food_info['days_remaining'] = (utils.str_to_datetime(food_info['expiration_date']) - current_date).days
+            result.update(code=200, message="성공적으로 조회되었습니다.", result=True, food_info=food_info)
+    
+    failed = next((result for result in results if not result['result']), None)
+    if failed:
+        return utils.ResultDTO(code=failed['code'], message=failed['message'], data={'results': results}, result=False)
+    return utils.ResultDTO(code=200, message="성공적으로 조회되었습니다.", data={'results': results}, result=True)
+
+FOOD_LIST_DEFAULT_LIMIT = 100
+FOOD_LIST_MAX_LIMIT = 500
+FOOD_LIST_SORTS = {
+    'expiration_asc': ('ASC', '>'),
+    'expiration_desc': ('DESC', '<')
+}
+
+# 유통기한까지 남은 일수. Python의 timedelta.days와 같이 내림(floor) 처리
+DAYS_REMAINING_SQL = """(CAST(julianday(expiration_date) - julianday(:now) AS INTEGER)
+    - (julianday(expiration_date) - julianday(:now) < CAST(julianday(expiration_date) - julianday(:now) AS INTEGER)))"""
+
+def encode_list_cursor(expiration_date: str, fid: str) -> str:
+    return base64.urlsafe_b64encode(f"{expiration_date}|{fid}".encode()).decode()
+
+def decode_list_cursor(cursor: str) -> tuple[str, str] | None:
+    try:
+        expiration_date, fid = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return expiration_date, fid
+
+def _make_list_etag(uid: str, rows: list, *extra) -> str:
+    # 목록 내용이 바뀌는 경우는 식품 추가/삭제(updated_at)와 남은 일수 변화뿐이므로 이 값들로 강한 ETag 생성
+    version = repr((uid, [(row['fid'], row['updated_at'], row['is_active'], row['days_remaining']) for row in rows], extra))
+    return f'"{utils.str_to_hash(version)[:32]}"'
+
+def _list_headers(etag: str) -> dict:
+    # 클라이언트마다 목록이 다르므로 공유 캐시에는 저장하지 않고, 매번 ETag로 재검증
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+def get_list_info(uid: str, active_only: bool = True, food_type: str = None, expiring_within: int = None,
+                  sort: str = 'expiration_asc', limit: int = FOOD_LIST_DEFAULT_LIMIT, cursor: str = None) -> utils.ResultDTO:
+    if sort not in FOOD_LIST_SORTS:
+        return utils.ResultDTO(code=400, message=f"정렬 방식은 {', '.join(FOOD_LIST_SORTS)} 중 하나여야 합니다.", result=False)
+    if limit is None or limit < 1 or limit > FOOD_LIST_MAX_LIMIT:
+        return utils.ResultDTO(code=400, message=f"limit은 1 이상 {FOOD_LIST_MAX_LIMIT} 이하이어야 합니다.", result=False)
+    if expiring_within is not None and expiring_within < 0:
+        return utils.ResultDTO(code=400, message="expiring_within은 0 이상이어야 합니다.", result=False)
+    
+    # 필터, 정렬, 페이지네이션 모두 SQL에서 처리. (expiration_date, fid) 기준 keyset 커서 사용
+    order, cursor_op = FOOD_LIST_SORTS[sort]
+    conditions = ["uid = :uid"]
+    params = {'uid': uid, 'now': utils.get_current_datetime_str(), 'limit': limit + 1}
+    if active_only:
+        conditions.append("is_active = 1")
+    if food_type:
+        conditions.append("type = :type")
+        params['type'] = food_type
+    if expiring_within is not None:
+        conditions.append("expiration_date <= :expiring_before")
+        params['expiring_before'] = utils.get_future_timestamp(days=expiring_within)
+    if cursor:
+        decoded_cursor = decode_list_cursor(cursor)
+        if decoded_cursor is None:
+            return utils.ResultDTO(code=400, message="유효하지 않은 커서입니다.", result=False)
+        conditions.append(f"(expiration_date, fid) {cursor_op} (:cursor_expiration_date, :cursor_fid)")
+        params['cursor_expiration_date'], params['cursor_fid'] = decoded_cursor
     
     conn = db.get_db_connection()
-    cursor = conn.cursor()
+    db_cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM foods WHERE uid = ?", (uid,))
-    rows = cursor.fetchall()
+    db_cursor.execute(f"""SELECT *, {DAYS_REMAINING_SQL} AS days_remaining FROM foods
+                      WHERE {' AND '.join(conditions)}
+                      ORDER BY expiration_date {order}, fid {order} LIMIT :limit""", params)
+    rows = db_cursor.fetchall()
     
-    if not rows:
-        db.close_db_connection(conn)
+    db.close_db_connection(conn)
+    
+    if not rows and not cursor:
         return utils.ResultDTO(code=404, message="등록된 식품 정보가 없습니다.", result=False)
     
+    rows, has_more = rows[:limit], len(rows) > limit
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_list_cursor(rows[-1]['expiration_date'], rows[-1]['fid'])
+    
+    headers = _list_headers(_make_list_etag(uid, rows, next_cursor))
     food_list = [dict(row) for row in rows]
+    return utils.ResultDTO(code=200, message="성공적으로 조회되었습니다.", data={'food_list': food_list, 'next_cursor': next_cursor}, result=True, headers=headers)
+
+# 변경분 동기화. updated_at은 초 단위라 같은 초에 늦게 커밋된 변경을 놓치지 않도록
+# 최근 FOOD_SYNC_SETTLE_SECONDS초 이내의 마지막 변경 시각은 다음 조회 때 다시 포함
+FOOD_SYNC_SETTLE_SECONDS = 5
+
+def _db_now() -> datetime:
+    # updated_at은 datetime('now', '+9 hours')로 저장됨
+    return datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=9)
+
+def get_changes(uid: str, since: str, limit: int = FOOD_LIST_MAX_LIMIT) -> utils.ResultDTO:
+    # since: 이전 응답의 next_since, 처음 동기화할 때는 '0'
+    if limit is None or limit < 1 or limit > FOOD_LIST_MAX_LIMIT:
+        return utils.ResultDTO(code=400, message=f"limit은 1 이상 {FOOD_LIST_MAX_LIMIT} 이하이어야 합니다.", result=False)
+    if since == '0':
+        since_updated_at, since_fid = '', ''
+    else:
+        decoded_since = decode_list_cursor(since or '')
+        if decoded_since is None:
+            return utils.ResultDTO(code=400, message="유효하지 않은 동기화 커서입니다.", result=False)
+        since_updated_at, since_fid = decoded_since
     
-    # 각 식품의 유통기한까지 남은 일수 계산
-    current_date = datetime.now()
-    for food in food_list:
-        expiration_date = utils.str_to_datetime(food['expiration_date'])
-        days_remaining = (expiration_date - current_date).days
-        food['days_remaining'] = days_remaining
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
     
-    food_list.sort(key=lambda x: x['expiration_date'])
+    # 삭제된 식품(is_active = 0)도 updated_at이 갱신되므로 함께 조회해 삭제 표시로 전달
+    cursor.execute(f"""SELECT *, {DAYS_REMAINING_SQL} AS days_remaining FROM foods
+                   WHERE uid = :uid AND (updated_at, fid) > (:since_updated_at, :since_fid)
+                   ORDER BY updated_at, fid LIMIT :limit""",
+                   {'uid': uid, 'now': utils.get_current_datetime_str(), 'since_updated_at': since_updated_at, 'since_fid': since_fid, 'limit': limit + 1})
+    rows = cursor.fetchall()
     
     db.close_db_connection(conn)
-    return utils.ResultDTO(code=200, message="성공적으로 조회되었습니다.", data={'food_list': food_list}, result=True)
-
-def regi_food_with_barcode(sid:str, barcode:str, food_count:int) -> utils.ResultDTO:
-    session_info = db.session.get_info(sid)
-    # 잘못된 세션 ID일 경우 실패 처리
-    if not session_info.result:
-        return session_info
     
+    rows, has_more = rows[:limit], len(rows) > limit
+    next_since = since
+    if rows:
+        last = rows[-1]
+        settled_before = utils.datetime_to_str(_db_now() - timedelta(seconds=FOOD_SYNC_SETTLE_SECONDS))
+        if has_more or last['updated_at'] < settled_before:
+            next_since = encode_list_cursor(last['updated_at'], last['fid'])
+        else:
+            next_since = encode_list_cursor(last['updated_at'], '')
+    
+    headers = _list_headers(_make_list_etag(uid, rows, next_since))
+    food_list = [dict(row) for row in rows if row['is_active']]
+    tombstones = [{'fid': row['fid'], 'updated_at': row['updated_at']} for row in rows if not row['is_active']]
+    return utils.ResultDTO(code=200, message="성공적으로 조회되었습니다.", data={'food_list': food_list, 'tombstones': tombstones, 'next_since': next_since, 'has_more': has_more},
+                           result=True, headers=headers)
+
+# 바꾸면 db.product.PRODUCT_LOOKUP_MAX_INFLIGHT 기본값(2배)도 함께 조정
+FOOD_BULK_MAX_ITEMS = 30
+
+def _validate_food_item(barcode: str, food_count: int) -> utils.ResultDTO | None:
     # 잘못된 바코드 값일 경우 실패 처리
     if not barcode or not utils.is_valid_barcode(barcode):
         return utils.ResultDTO(code=400, message="유효하지 않은 바코드 형식입니다. (12~13자리 숫자)", result=False)
     
     # 잘못된 식품 수량일 경우 실패 처리
-    if food_count <= 0 or food_count > 100:
+    if food_count is None or food_count <= 0 or food_count > 100:
         return utils.ResultDTO(code=400, message="식품 수량은 1 이상 100 이하이어야 합니다.", result=False)
-    
-    # 식품의 이름, 종류(유탕면, 음료 등), 유통기한 가져오기
-    food_name = None
-    food_type = "정보 없음"
+    return None
+
+def _make_food_row(fid: str, uid: str, barcode: str, food_count: int, product: dict) -> tuple:
+    # 식품의 이름, 종류(유탕면, 음료 등), 유통기한
+    food_name = product['name']
+    food_type = product['type']
     food_expiration_date = datetime.now() + timedelta(days=3*30)
     food_expiration_date_desc = "3개월 이내(소비기한 정보 없음)"
-    food_image_url = None
-    food_volume = None
-    try:
-        # get Food name, type, expiration date
-        foodsafety_api_url = f"http://openapi.foodsafetykorea.go.kr/api/{os.environ['FOODSAFETYKOREA_API_KEY']}/C005/json/1/100/BAR_CD={barcode}"
-        response = requests.get(foodsafety_api_url)
-        response.raise_for_status()
-        response_json = response.json()
-        row = response_json['C005']['row'][0]
-        food_name = row['PRDLST_NM']
-        food_type = row['PRDLST_DCNM']
-        food_expiration_date = datetime.now() + timedelta(days=utils.extract_months(row['POG_DAYCNT'])*30)
-        food_expiration_date_desc = row['POG_DAYCNT']
-    except:
-        # return utils.ResultDTO(code=400, message="식품 정보를 찾을 수 없습니다.", result=False)
-        pass
-    
-    try:
-        retaildb_api_url = f"https://www.retaildb.or.kr/service/product_info/search/{barcode}"
-        response = requests.get(retaildb_api_url, verify=False)
-        response_json = response.json()
-        food_name = response_json['baseItems'][0]['value']
-        food_volume = response_json['originVolume']
-        food_image_url = response_json['images'][0]
-    except:
-        pass
+    food_image_url = product['image_url']
+    food_volume = product['volume']
+    food_expiration_months = utils.extract_months(product['pog_daycnt']) if product['pog_daycnt'] else None
+    if food_expiration_months is not None:
+        food_expiration_date = datetime.now() + timedelta(days=food_expiration_months*30)
+        food_expiration_date_desc = product['pog_daycnt']
     
     # Get Ingredients
-    ingredients = '정보없음'
-    with open(os.path.join(os.path.dirname(__file__), '../static/ingredients_info.json'), 'r', encoding='utf-8') as f:
-        ingredients_data = json.load(f)
-        if barcode in ingredients_data:
-            ingredients = ingredients_data[barcode]
+    ingredients = src.ingredients.store.get(barcode) or '정보없음'
     
+    return (fid, uid, food_name, food_type, ingredients, f"[메모] {food_name}", food_count, food_volume, food_image_url, barcode, food_expiration_date_desc, utils.datetime_to_str(food_expiration_date))
+
+def regi_food_with_barcode(uid:str, barcode:str, food_count:int) -> utils.ResultDTO:
+    validate_error = _validate_food_item(barcode, food_count)
+    if validate_error:
+        return validate_error
+    
+    # 바코드 상품 캐시 우선 조회
+    product = db.product.get_product(barcode)
+    if not product['is_found'] and not product['is_complete']:
+        # 외부 API 응답 지연. 없는 상품과 구분해 다시 시도할 수 있도록 503
+        return utils.ResultDTO(code=503, message="식품 정보 조회가 지연되고 있습니다. 잠시 후 다시 시도하세요.", result=False)
+    if not product['is_found']:
+        return utils.ResultDTO(code=404, message="식품 정보를 찾을 수 없습니다.", result=False)
+
     # DB
     fid = utils.gen_hash(16)
-    uid = session_info.data['session_info']['uid']
     conn = db.get_db_connection()
     cursor = conn.cursor()
 
     try:
         cursor.execute("INSERT INTO foods (fid, uid, name, type, ingredients, description, count, volume, image_url, barcode, expiration_date_desc, expiration_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    (fid, uid, food_name, food_type, ingredients, f"[메모] {food_name}", food_count, food_volume, food_image_url, barcode, food_expiration_date_desc, utils.datetime_to_str(food_expiration_date)))
+                    _make_food_row(fid, uid, barcode, food_count, product))
         conn.commit()
         db.close_db_connection(conn)
     except Exception as e:
         db.close_db_connection(conn)
         return utils.ResultDTO(code=409, message=f"등록 중 오류가 발생했습니다: {str(e)}", result=False)
 
-    return utils.ResultDTO(code=200, message="식품 등록 성공", data=get_info(sid, fid).data, result=True)
\ No newline at end of file
+    return utils.ResultDTO(code=200, message="식품 등록 성공", data=get_info(uid, fid).data, result=True)
+
+def regi_foods_with_barcodes(uid: str, items: list) -> utils.ResultDTO:
+    # items: [(바코드, 수량), ...]
+    if not items:
+        return utils.ResultDTO(code=400, message="등록할 식품 목록이 비어 있습니다.", result=False)
+    if len(items) > FOOD_BULK_MAX_ITEMS:
+        return utils.ResultDTO(code=400, message=f"한 번에 최대 {FOOD_BULK_MAX_ITEMS}개까지 등록할 수 있습니다.", result=False)
+    
+    results = [{'index': index, 'barcode': barcode, 'count': food_count, 'result': False} for index, (barcode, food_count) in enumerate(items)]
+    
+    valid_results = []
+    for result in results:
+        validate_error = _validate_food_item(result['barcode'], result['count'])
+        if validate_error:
+            result.update(code=validate_error.code, message=validate_error.message)
+            continue
+        valid_results.append(result)
+    
+    # 중복 바코드는 한 번만 조회하고, 캐시에 없는 상품은 동시에 조회
+    products = db.product.get_products([result['barcode'] for result in valid_results])
+    
+    rows = []
+    for result in valid_results:
+        product = products[result['barcode']]
+        if not product['is_found'] and not product['is_complete']:
+            # 외부 API 응답 지연. 없는 상품과 구분해 다시 시도할 수 있도록 503
+            result.update(code=503, message="식품 정보 조회가 지연되고 있습니다. 잠시 후 다시 시도하세요.")
+            continue
+        if not product['is_found']:
+            result.update(code=404, message="식품 정보를 찾을 수 없습니다.")
+            continue
+        result['fid'] = utils.gen_hash(16)
+        rows.append(_make_food_row(result['fid'], uid, result['barcode'], result['count'], product))
+    
+    # 한 트랜잭션에서 모두 등록
+    if rows:
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany("INSERT INTO foods (fid, uid, name, type, ingredients, description, count, volume, image_url, barcode, expiration_date_desc, expiration_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            db.rollback_request()
+            db.close_db_connection(conn)
+            return utils.ResultDTO(code=409, message=f"등록 중 오류가 발생했습니다: {str(e)}", result=False)
+        
+        placeholders = ', '.join('?' * len(rows))
+        cursor.execute(f"SELECT * FROM foods WHERE uid = ? AND fid IN ({placeholders})", (uid, *[row[0] for row in rows]))
+        food_infos = {row['fid']: row for row in cursor.fetchall()}
+        db.close_db_connection(conn)
+        
+        current_date = datetime.now()
+        for result in valid_results:
+            if result.get('fid') in food_infos:
+                food_info = dict(food_infos[result['fid']])
+                food_info['days_remaining'] = (utils.str_to_datetime(food_info['expiration_date']) - current_date).days
+                result.update(code=200, message="식품 등록 성공", result=True, food_info=food_info)
+    
+    success_count = sum(1 for result in results if result['result'])
+    if not success_count:
+        if any(result.get('code') == 503 for result in results):
+            return utils.ResultDTO(code=503, message="식품 정보 조회가 지연되고 있습니다. 잠시 후 다시 시도하세요.", data={'results': results}, result=False)
+        return utils.ResultDTO(code=400, message="등록된 식품이 없습니다.", data={'results': results}, result=False)
+    return utils.ResultDTO(code=200, message=f"식품 {success_count}/{len(results)}개 등록 성공", data={'results': results}, result=True)
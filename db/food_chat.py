@@ -1,51 +1,339 @@
 import src.utils as utils
 import db
-import db.session
 import db.food
+import db.lease_queue
+import math
+import os
+import sqlite3
 import time
-from openai import OpenAI
+import src.llm
+from src.cache import TTLCache
 from datetime import datetime
 import threading
 
-class FoodChat:
-    gen_chat_queue = []
-    create_queue = []
-    
-    def __init__(self):
-        # 대화 생성 스레드 시작
-        def chat_generating_thread():
-            while True:
-                if self.gen_chat_queue:
-                    chat_info = self.gen_chat_queue.pop(0)
-                    sid = chat_info['sid']
-                    fcid = chat_info['fcid']
-
-                    result = generate_chat(sid, fcid)
-                    
-                    continue
-            
-                time.sleep(10)
-
-        threading.Thread(target=chat_generating_thread, daemon=True).start()
-
-    def queue_add(self, sid: str, fcid: str):
-        self.gen_chat_queue.append({
-            'sid': sid,
-            'fcid': fcid
+# 대화 생성 스케줄러. 비용이 큰 OpenAI 호출을 사용자 간에 공정하게 나눔
+# - 사용자별 대기열 순서 + 진행 중인 개수가 작은 대화부터 가져가므로 사용자 간 round-robin
+# - 사용자별, 전체(모든 프로세스 합산) 동시 생성 수 제한
+# - 최근 1분간 사용한 토큰(usage_input_token + usage_output_token)과 진행 중인 생성의 예상 토큰이 예산을 넘으면 대기
+class FoodChatScheduler:
+    def __init__(self, user_concurrency: int, global_concurrency: int, user_max_pending: int, tokens_per_minute: int,
+                 tokens_per_generation: int, generation_seconds: float):
+        self.user_concurrency = user_concurrency
+        self.global_concurrency = global_concurrency
+        self.user_max_pending = user_max_pending
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens_per_generation = tokens_per_generation
+        # 생성 소요 시간 추정치(지수 이동 평균). 대기 시간 안내에 사용
+        self.generation_seconds = generation_seconds
+        self._lock = threading.Lock()
+        self._stats = {
+            'rejected': 0,
+            'deferred': 0
+        }
+
+    def record_generation(self, seconds: float):
+        with self._lock:
+            self.generation_seconds = self.generation_seconds * 0.8 + seconds * 0.2
+
+    def get_budget_usage(self) -> dict:
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""SELECT COALESCE(SUM(usage_input_token + usage_output_token), 0) AS used_tokens,
+                       (julianday('now', '+9 hours') - julianday(MIN(updated_at))) * 86400 AS oldest_age
+                       FROM food_chat WHERE status = 'completed' AND updated_at >= datetime('now', '+9 hours', '-60 seconds')""")
+        usage = dict(cursor.fetchone())
+        cursor.execute("SELECT COUNT(*) FROM food_chat WHERE status = 'creating'")
+        usage['running'] = cursor.fetchone()[0]
+        db.close_db_connection(conn)
+        return usage
+
+    def get_budget_wait(self) -> float:
+        # 토큰 예산을 넘었으면 가장 오래된 사용량이 1분 구간에서 빠질 때까지의 시간(초), 여유가 있으면 0
+        if self.tokens_per_minute <= 0:
+            return 0
+        usage = self.get_budget_usage()
+        if usage['used_tokens'] + (usage['running'] + 1) * self.tokens_per_generation <= self.tokens_per_minute:
+            return 0
+        with self._lock:
+            self._stats['deferred'] += 1
+            generation_seconds = self.generation_seconds
+        if usage['oldest_age'] is None:
+            # 진행 중인 생성만으로 예산이 찬 경우 생성이 끝날 때까지 대기
+            return max(1.0, generation_seconds)
+        return max(1.0, 60 - usage['oldest_age'])
+
+    def estimate_wait(self, queued_ahead: int) -> int:
+        # 앞에 대기 중인 대화가 전체 동시 생성 수만큼씩 처리된다고 보고 계산한 대기 시간(초)
+        with self._lock:
+            generation_seconds = self.generation_seconds
+        rounds = queued_ahead // max(1, self.global_concurrency) + 1
+        return math.ceil(self.get_budget_wait() + rounds * generation_seconds)
+
+    def admit(self, uid: str) -> utils.ResultDTO | None:
+        # 사용자별 대기/진행 중인 대화 수 제한. 초과 시 Retry-After와 함께 거절
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM food_chat WHERE uid = ? AND status IN ('queued', 'creating')", (uid,))
+        pending = cursor.fetchone()[0]
+        db.close_db_connection(conn)
+        if pending < self.user_max_pending:
+            return None
+
+        with self._lock:
+            self._stats['rejected'] += 1
+            generation_seconds = self.generation_seconds
+        # 이 사용자의 대화가 사용자별 동시 생성 수만큼씩 처리되어 한 자리가 빌 때까지의 시간
+        retry_after = math.ceil(self.get_budget_wait() + (pending - self.user_max_pending + self.user_concurrency) // max(1, self.user_concurrency) * generation_seconds)
+        return utils.ResultDTO(code=429, message=f"처리 중인 대화가 너무 많습니다. {retry_after}초 후 다시 시도해주세요.",
+                               data={'retry_after': retry_after}, result=False, headers={'Retry-After': str(retry_after)})
+
+    def stats(self) -> dict:
+        usage = self.get_budget_usage()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['generation_seconds'] = round(self.generation_seconds, 2)
+        stats['running'] = usage['running']
+        stats['used_tokens_per_minute'] = usage['used_tokens']
+        stats['tokens_per_minute'] = self.tokens_per_minute
+        stats['user_concurrency'] = self.user_concurrency
+        stats['global_concurrency'] = self.global_concurrency
+        return stats
+
+# 대화 생성 작업 큐. food_chat 테이블을 큐로 사용(db.lease_queue.LeaseQueue)
+# 사용자 간 round-robin으로 가져가고, 토큰 예산을 넘으면 여유가 생길 때까지 가져가지 않음
+class FoodChat(db.lease_queue.LeaseQueue):
+    def __init__(self, scheduler: FoodChatScheduler, workers: int, shutdown_timeout: float, lease_seconds: float, poll_interval: float, max_attempts: int):
+        super().__init__('food-chat', 'food_chat', 'fcid', 'creating', 'failed', workers=workers, lease_seconds=lease_seconds,
+                         poll_interval=poll_interval, shutdown_timeout=shutdown_timeout, max_attempts=max_attempts)
+        self.scheduler = scheduler
+        self._active = 0
+        self._stats.update({
+            'completed': 0,
+            'failed': 0
         })
+        self._timings.update({key: [0.0, 0.0, 0] for key in ('wait', 'generation')})
+        self.start()
+
+    def claim(self) -> dict | None:
+        # 다음 순서의 queued 대화 하나를 한 번의 UPDATE로 가져감. 대기 시간은 created_at 기준(초 단위)
+        # 사용자별 대기열 순서(position)에 진행 중인 개수를 더한 값이 작은 대화부터 가져가므로 사용자 간 round-robin
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            # query-plan: allow-sort 순서가 계산 값이라 queued 대화를 정렬해야 함
+            cursor.execute("""UPDATE food_chat SET status = 'creating', lease_owner = ?, lease_expires_at = datetime('now', '+9 hours', ?),
+                           attempts = attempts + 1, updated_at = datetime('now', '+9 hours')
+                           WHERE fcid = (
+                               WITH running AS (SELECT uid, COUNT(*) AS running FROM food_chat WHERE status = 'creating' GROUP BY uid),
+                               queued AS (SELECT fcid, uid, created_at, ROW_NUMBER() OVER (PARTITION BY uid ORDER BY created_at) AS position
+                                          FROM food_chat WHERE status = 'queued')
+                               SELECT queued.fcid FROM queued LEFT JOIN running ON running.uid = queued.uid
+                               WHERE COALESCE(running.running, 0) < ? AND (SELECT COUNT(*) FROM food_chat WHERE status = 'creating') < ?
+                               ORDER BY queued.position + COALESCE(running.running, 0), queued.created_at LIMIT 1)
+                           RETURNING fcid, uid, (julianday('now', '+9 hours') - julianday(created_at)) * 86400000 AS wait_ms""",
+                           (self.lease_owner, f"+{self.lease_seconds} seconds", self.scheduler.user_concurrency, self.scheduler.global_concurrency))
+            row = cursor.fetchone()
+            conn.commit()
+        finally:
+            db.close_db_connection(conn)
+        return dict(row) if row else None
+
+    def _finish_unfinished(self, fcid: str):
+        try:
+            status = self.requeue_unfinished(fcid)
+        except sqlite3.Error as e:
+            # lease를 더 연장하지 않으므로 만료 후 recover_expired에서 처리
+            print(f"Failed to finish food chat job: {e}")
+            return
+        if status == 'failed':
+            chat_status_notifier.notify(fcid)
+
+    def _worker(self):
+        while not self._stop_event.is_set():
+            chat_info = None
+            wait = self.poll_interval
+            try:
+                # 토큰 예산을 넘었으면 예산에 여유가 생길 때까지 가져가지 않음
+                budget_wait = self.scheduler.get_budget_wait()
+                if budget_wait:
+                    wait = min(budget_wait, self.lease_seconds)
+                else:
+                    chat_info = self.claim()
+            except sqlite3.Error as e:
+                print(f"Failed to claim food chat job: {e}")
+            if chat_info is None:
+                self.wait(wait)
+                continue
+
+            started_at = time.monotonic()
+            self.hold([chat_info['fcid']])
+            with self._lock:
+                self._active += 1
+
+            success = False
+            try:
+                success = generate_chat(chat_info['uid'], chat_info['fcid'], self.lease_owner).result
+            except Exception as e:
+                print(f"Failed to generate food chat: {e}")
+            finally:
+                # 생성 전에 오류가 난 경우 등 아직 creating이면 다시 대기열로(재시도 횟수를 넘으면 실패)
+                if not success:
+                    self._finish_unfinished(chat_info['fcid'])
+                self.unhold([chat_info['fcid']])
+
+            generation_ms = (time.monotonic() - started_at) * 1000
+            self.scheduler.record_generation(generation_ms / 1000)
+            self.record('wait', max(0.0, chat_info['wait_ms']))
+            self.record('generation', generation_ms)
+            with self._lock:
+                self._active -= 1
+                self._stats['completed' if success else 'failed'] += 1
+
+    def queue_add(self, uid: str, fcid: str):
         food_chat_config(fcid, status='queued')
+        # 요청 트랜잭션이 커밋된 뒤에 워커를 깨워야 대화를 가져갈 수 있음
+        db.on_commit(self.notify)
 
-foodchat_service = FoodChat()
+    def estimate_wait(self, chat_info: dict) -> int:
+        # queued 대화가 생성을 시작하기까지 예상 대기 시간(초)
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM food_chat WHERE status = 'queued' AND created_at < ?", (chat_info['created_at'],))
+        queued_ahead = cursor.fetchone()[0]
+        db.close_db_connection(conn)
+        return self.scheduler.estimate_wait(queued_ahead)
 
-def get_info(sid: str, fcid: str) -> utils.ResultDTO:
-    session_info = db.session.get_info(sid)
-    if not session_info.result:
-        return session_info
-    if session_info.data['session_info']['is_active'] == 0:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
-    
-    uid = session_info.data['session_info']['uid']
-    
+    def get_queue_depth(self) -> int:
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM food_chat WHERE status = 'queued'")
+        queue_depth = cursor.fetchone()[0]
+        db.close_db_connection(conn)
+        return queue_depth
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats['active'] = self._active
+        stats['scheduler'] = self.scheduler.stats()
+        stats['queue_depth'] = self.get_queue_depth()
+        return stats
+
+# 생성 중인 대화의 출력 스트림. 같은 프로세스에서 생성 중인 대화는 토큰 단위로 구독 가능
+# 완료 후에도 retention초 동안 보관해 늦게 연결한 구독자도 처음부터 받을 수 있음
+class ChatStream:
+    def __init__(self):
+        self.chunks = []
+        self.status = None
+        self.closed_at = None
+        self.condition = threading.Condition()
+
+    def publish(self, delta: str):
+        with self.condition:
+            self.chunks.append(delta)
+            self.condition.notify_all()
+
+    def close(self, status: str):
+        with self.condition:
+            if self.status is None:
+                self.status = status
+                self.closed_at = time.monotonic()
+            self.condition.notify_all()
+
+    def wait(self, offset: int, timeout: float) -> tuple[list, str | None]:
+        # offset 이후의 출력과 종료 상태 반환. 새 출력이 없으면 timeout까지 대기
+        with self.condition:
+            if len(self.chunks) <= offset and self.status is None:
+                self.condition.wait(timeout)
+            return self.chunks[offset:], self.status
+
+class ChatStreamHub:
+    def __init__(self, retention: float):
+        self.retention = retention
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._opened = threading.Condition(self._lock)
+
+    def _purge(self):
+        now = time.monotonic()
+        for fcid in [fcid for fcid, stream in self._streams.items() if stream.closed_at is not None and now - stream.closed_at > self.retention]:
+            del self._streams[fcid]
+
+    def open(self, fcid: str) -> ChatStream:
+        with self._lock:
+            self._purge()
+            previous = self._streams.get(fcid)
+            stream = self._streams[fcid] = ChatStream()
+            self._opened.notify_all()
+        # 재시도로 다시 생성하는 경우 기존 구독자에게 처음부터 다시 받도록 알림
+        if previous is not None:
+            previous.close('restarted')
+        return stream
+
+    def get(self, fcid: str) -> ChatStream | None:
+        with self._lock:
+            self._purge()
+            return self._streams.get(fcid)
+
+    def wait_for(self, fcid: str, timeout: float, exclude: ChatStream = None) -> ChatStream | None:
+        # 이 프로세스에서 생성이 시작되면 바로 반환
+        with self._lock:
+            self._opened.wait_for(lambda: self._streams.get(fcid) not in (None, exclude), timeout)
+            stream = self._streams.get(fcid)
+            return None if stream is exclude else stream
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'streams': len(self._streams),
+                'generating': sum(1 for stream in self._streams.values() if stream.status is None)
+            }
+
+chat_streams = ChatStreamHub(retention=float(os.environ.get('FOOD_CHAT_STREAM_RETENTION', 60)))
+
+# 대화 완료/실패 알림. 같은 프로세스에서 끝난 대화는 대기 중인 요청을 바로 깨움
+# 다른 프로세스에서 끝난 대화는 wait_for_chat이 poll_interval마다 DB를 확인
+class ChatStatusNotifier:
+    def __init__(self, retention: float = 60):
+        self.retention = retention
+        self._finished = {}
+        self._waiting = 0
+        self._condition = threading.Condition()
+        self._stats = {
+            'waits': 0,
+            'notified': 0,
+            'timeouts': 0
+        }
+
+    def notify(self, fcid: str):
+        now = time.monotonic()
+        with self._condition:
+            for finished_fcid in [key for key, finished_at in self._finished.items() if now - finished_at > self.retention]:
+                del self._finished[finished_fcid]
+            self._finished[fcid] = now
+            self._condition.notify_all()
+
+    def wait(self, fcid: str, timeout: float) -> bool:
+        with self._condition:
+            self._waiting += 1
+            try:
+                return self._condition.wait_for(lambda: fcid in self._finished, timeout)
+            finally:
+                self._waiting -= 1
+
+    def record(self, result: str):
+        with self._condition:
+            self._stats[result] += 1
+
+    def stats(self) -> dict:
+        with self._condition:
+            stats = dict(self._stats)
+            stats['waiting'] = self._waiting
+        return stats
+
+chat_status_notifier = ChatStatusNotifier()
+
+def get_info(uid: str, fcid: str) -> utils.ResultDTO:
     conn = db.get_db_connection()
     cursor = conn.cursor()
     
@@ -69,51 +357,111 @@ def get_info(sid: str, fcid: str) -> utils.ResultDTO:
     
     return utils.ResultDTO(code=200, message="성공적으로 조회했습니다.", data={'chat_info': row, 'food_ids': food_ids}, result=True)
 
-def get_list_info(sid: str) -> utils.ResultDTO:
-    session_info = db.session.get_info(sid)
-    if not session_info.result:
-        return session_info
-    if session_info.data['session_info']['is_active'] == 0:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
+def get_status(uid: str, fcid: str) -> utils.ResultDTO:
+    # 대기 중인 대화는 예상 대기 시간(retry_after)을 함께 반환
+    food_chat_info = get_info(uid, fcid)
+    if food_chat_info.result and food_chat_info.data['chat_info']['status'] == 'queued':
+        retry_after = foodchat_service.estimate_wait(food_chat_info.data['chat_info'])
+        food_chat_info.data['retry_after'] = retry_after
+        food_chat_info.headers = {'Retry-After': str(retry_after)}
+    return food_chat_info
+
+FOOD_CHAT_WAIT_MAX_SECONDS = float(os.environ.get('FOOD_CHAT_WAIT_MAX_SECONDS', 30))
+FOOD_CHAT_WAIT_POLL_INTERVAL = float(os.environ.get('FOOD_CHAT_WAIT_POLL_INTERVAL', 1))
+
+def _get_chat_status(uid: str, fcid: str) -> str | None:
+    # 대기 중에는 요청 연결을 점유하지 않도록 풀에서 잠깐 빌려 조회
+    conn = db.pool.acquire()
+    try:
+        row = conn.execute("SELECT status FROM food_chat WHERE fcid = ? AND uid = ?", (fcid, uid)).fetchone()
+    finally:
+        db.pool.release(conn)
+    return row['status'] if row else None
+
+def wait_for_chat(uid: str, fcid: str, timeout: float) -> utils.ResultDTO:
+    # 대화가 완료/실패하거나 timeout이 지날 때까지 대기한 뒤 get_status와 같은 결과 반환
+    db.release_request_connection()
+    deadline = time.monotonic() + min(timeout, FOOD_CHAT_WAIT_MAX_SECONDS)
+    chat_status_notifier.record('waits')
+    while True:
+        status = _get_chat_status(uid, fcid)
+        if status is None or status in ('completed', 'failed'):
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            chat_status_notifier.record('timeouts')
+            break
+        if chat_status_notifier.wait(fcid, min(remaining, FOOD_CHAT_WAIT_POLL_INTERVAL)):
+            chat_status_notifier.record('notified')
+    return get_status(uid, fcid)
+
+FOOD_CHAT_LIST_DEFAULT_LIMIT = 20
+FOOD_CHAT_LIST_MAX_LIMIT = 100
+FOOD_CHAT_LIST_SORTS = {
+    'created_asc': ('ASC', '>'),
+    'created_desc': ('DESC', '<')
+}
+# 목록에서 response 표시 방식. full: 전체, preview: 앞부분만, none: 제외
+FOOD_CHAT_RESPONSE_MODES = ('full', 'preview', 'none')
+FOOD_CHAT_RESPONSE_PREVIEW_LENGTH = int(os.environ.get('FOOD_CHAT_RESPONSE_PREVIEW_LENGTH', 100))
+
+def get_list_info(uid: str, sort: str = 'created_asc', limit: int = FOOD_CHAT_LIST_DEFAULT_LIMIT, cursor: str = None, response: str = 'full') -> utils.ResultDTO:
+    if sort not in FOOD_CHAT_LIST_SORTS:
+        return utils.ResultDTO(code=400, message=f"정렬 방식은 {', '.join(FOOD_CHAT_LIST_SORTS)} 중 하나여야 합니다.", result=False)
+    if limit is None or limit < 1 or limit > FOOD_CHAT_LIST_MAX_LIMIT:
+        return utils.ResultDTO(code=400, message=f"limit은 1 이상 {FOOD_CHAT_LIST_MAX_LIMIT} 이하이어야 합니다.", result=False)
+    if response not in FOOD_CHAT_RESPONSE_MODES:
+        return utils.ResultDTO(code=400, message=f"response는 {', '.join(FOOD_CHAT_RESPONSE_MODES)} 중 하나여야 합니다.", result=False)
     
-    uid = session_info.data['session_info']['uid']
+    # 대화와 식품 ID 목록을 한 번의 쿼리로 조회. (created_at, fcid) 기준 keyset 커서 사용
+    order, cursor_op = FOOD_CHAT_LIST_SORTS[sort]
+    conditions = ["uid = :uid"]
+    params = {'uid': uid, 'limit': limit + 1, 'preview_length': FOOD_CHAT_RESPONSE_PREVIEW_LENGTH}
+    if cursor:
+        decoded_cursor = db.food.decode_list_cursor(cursor)
+        if decoded_cursor is None:
+            return utils.ResultDTO(code=400, message="유효하지 않은 커서입니다.", result=False)
+        conditions.append(f"(created_at, fcid) {cursor_op} (:cursor_created_at, :cursor_fcid)")
+        params['cursor_created_at'], params['cursor_fcid'] = decoded_cursor
+    response_sql = {
+        'full': "response",
+        'preview': "substr(response, 1, :preview_length)",
+        'none': "NULL"
+    }[response]
     
     conn = db.get_db_connection()
-    cursor = conn.cursor()
+    db_cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM food_chat WHERE uid = ?", (uid,))
-    rows = cursor.fetchall()
+    db_cursor.execute(f"""SELECT fcid, uid, status, {response_sql} AS response, usage_input_token, usage_output_token, created_at, updated_at,
+                      (SELECT group_concat(fid) FROM food_chat_items WHERE food_chat_items.fcid = food_chat.fcid) AS food_ids
+                      FROM food_chat WHERE {' AND '.join(conditions)}
+                      ORDER BY created_at {order}, fcid {order} LIMIT :limit""", params)
+    rows = db_cursor.fetchall()
     
-    if not rows:
-        db.close_db_connection(conn)
+    db.close_db_connection(conn)
+    
+    if not rows and not cursor:
         return utils.ResultDTO(code=404, message="등록된 대화 정보가 없습니다.", result=False)
     
+    rows, has_more = rows[:limit], len(rows) > limit
     chat_list = []
     for row in rows:
-        row = dict(row)
-        # food_chat_items에서 해당 fcid에 대한 식품 ID 목록 조회
-        cursor.execute("SELECT fid FROM food_chat_items WHERE fcid = ?", (row['fcid'],))
-        items = cursor.fetchall()
-        
-        food_ids = [item['fid'] for item in items]
-        
+        chat_info = dict(row)
+        food_ids = chat_info.pop('food_ids')
+        if response == 'none':
+            del chat_info['response']
         chat_list.append({
-            'chat_info': row,
-            'food_ids': food_ids
+            'chat_info': chat_info,
+            'food_ids': food_ids.split(',') if food_ids else []
         })
     
-    db.close_db_connection(conn)
+    next_cursor = None
+    if has_more:
+        next_cursor = db.food.encode_list_cursor(rows[-1]['created_at'], rows[-1]['fcid'])
     
-    return utils.ResultDTO(code=200, message="성공적으로 조회했습니다.", data={'chat_list': chat_list}, result=True)
+    return utils.ResultDTO(code=200, message="성공적으로 조회했습니다.", data={'chat_list': chat_list, 'next_cursor': next_cursor}, result=True)
 
-def create_chat_db(sid: str, fid_list: list) -> utils.ResultDTO:
-    session_info = db.session.get_info(sid)
-    if not session_info.result:
-        return session_info
-    if session_info.data['session_info']['is_active'] == 0:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
-    uid = session_info.data['session_info']['uid']
-    
+def create_chat_db(uid: str, fid_list: list) -> utils.ResultDTO:
     if not fid_list:
         return utils.ResultDTO(code=400, message="식품 ID 목록이 비어 있습니다.", result=False)
     if len(fid_list) < 1:
@@ -121,36 +469,45 @@ def create_chat_db(sid: str, fid_list: list) -> utils.ResultDTO:
     if len(fid_list) > 10:
         return utils.ResultDTO(code=400, message="식품 ID 목록은 최대 10개까지 가능합니다.", result=False)
     
-    food_info_list = []
-    for index, fid in enumerate(fid_list):
-        food_info = db.food.get_info(sid, fid)
-        if not food_info.result:
-            food_info.message = f"식품 ID 조회에 실패했습니다: [{index}] {food_info.message}"
-            return food_info
-        # 중복된 식품 ID는 제외
-        if any(food['fid'] == fid for food in food_info_list):
-            continue
-        food_info_list.append(food_info.data['food_info'])
+    food_infos = db.food.get_many(uid, fid_list)
+    if not food_infos.result:
+        failed = next(result for result in food_infos.data['results'] if not result['result'])
+        return utils.ResultDTO(code=failed['code'], message=f"식품 ID 조회에 실패했습니다: [{failed['index']}] {failed['message']}", result=False)
+    
+    # 중복된 식품 ID는 제외
+    food_info_list = list({result['fid']: result['food_info'] for result in food_infos.data['results']}.values())
+
+    # 같은 재료와 식사 시간대의 레시피가 캐시에 있으면 대기열을 거치지 않고 바로 완료(토큰 사용량 0)
+    output_text = recipe_cache.get(make_recipe_key(food_info_list, get_meal_slot(datetime.now().hour)))
+    if output_text is None:
+        admission_error = foodchat_service.scheduler.admit(uid)
+        if admission_error:
+            return admission_error
 
     # 대화 생성
     con = db.get_db_connection()
     cursor = con.cursor()
     ## food_chat 테이블 데이터 삽입
     fcid = utils.gen_hash(16)
-    cursor.execute('''INSERT INTO food_chat (fcid, uid) VALUES (?, ?)''', (fcid, uid))
+    if output_text is None:
+        cursor.execute('''INSERT INTO food_chat (fcid, uid) VALUES (?, ?)''', (fcid, uid))
+    else:
+        cursor.execute('''INSERT INTO food_chat (fcid, uid, status, response, usage_input_token, usage_output_token) VALUES (?, ?, 'completed', ?, 0, 0)''',
+                       (fcid, uid, output_text))
     con.commit()
-    for food_info in food_info_list:
-        cursor.execute('''INSERT INTO food_chat_items (fcid, fid) VALUES (?, ?)''', (fcid, food_info['fid']))
+    cursor.executemany('''INSERT INTO food_chat_items (fcid, fid) VALUES (?, ?)''', [(fcid, food_info['fid']) for food_info in food_info_list])
     con.commit()
     
     db.close_db_connection(con)
     
     # add to queue
-    foodchat_service.queue_add(sid, fcid)
+    if output_text is None:
+        foodchat_service.queue_add(uid, fcid)
     
-    return utils.ResultDTO(code=200, message="대화 정보가 성공적으로 생성되었습니다.", data=get_info(sid, fcid).data, result=True)
+    return utils.ResultDTO(code=200, message="대화 정보가 성공적으로 생성되었습니다.", data=get_info(uid, fcid).data, result=True)
 
-def food_chat_config(fcid: str, status: str = None, response: str = None, usage_input_tokens: int = None, usage_output_tokens: int = None) -> utils.ResultDTO:
+def food_chat_config(fcid: str, status: str = None, response: str = None, usage_input_tokens: int = None, usage_output_tokens: int = None,
+                     lease_owner: str = None) -> utils.ResultDTO:
     # None 값이 아닌 경우에만 업데이트
     updates = []
     params = []
@@ -170,47 +527,125 @@ def food_chat_config(fcid: str, status: str = None, response: str = None, usage_
     if not updates:
         return utils.ResultDTO(code=400, message="업데이트할 필드가 없습니다.", result=False)
     
+    # lease_owner를 지정하면 lease를 가진 워커일 때만 반영하고, 완료/실패 시 lease 해제
+    conditions = ["fcid = ?"]
+    params.append(fcid)
+    if lease_owner is not None:
+        conditions.append("lease_owner = ?")
+        params.append(lease_owner)
+        if status in ('completed', 'failed'):
+            updates.append("lease_owner = NULL, lease_expires_at = NULL")
+    
     conn = db.get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute(f"UPDATE food_chat SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE fcid = ?", [*params, fcid])
+    cursor.execute(f"UPDATE food_chat SET {', '.join(updates)}, updated_at = datetime('now', '+9 hours') WHERE {' AND '.join(conditions)}", params)
     conn.commit()
+    updated = cursor.rowcount
     db.close_db_connection(conn)
 
+    if lease_owner is not None and not updated:
+        return utils.ResultDTO(code=409, message="대화 생성 권한(lease)이 만료되었습니다.", result=False)
+    if updated and status in ('completed', 'failed'):
+        db.on_commit(lambda: chat_status_notifier.notify(fcid))
     return utils.ResultDTO(code=200, message="설정이 성공적으로 업데이트되었습니다.", result=True)
 
-def generate_chat(sid: str, fcid: str) -> utils.ResultDTO:
-    session_info = db.session.get_info(sid)
-    if not session_info.result:
-        return session_info
-    if session_info.data['session_info']['is_active'] == 0:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
-    uid = session_info.data['session_info']['uid']
-    
-    food_chat_info = get_info(sid, fcid)
-    if not food_chat_info.result:
-        return food_chat_info
-    
-    chat_info = food_chat_info.data['chat_info']
-    if chat_info['status'] == 'creating':
-        return utils.ResultDTO(code=400, message="생성 중인 대화입니다.", result=False)
-    elif chat_info['status'] == 'completed':
-        return utils.ResultDTO(code=400, message="이미 완료된 대화입니다.", result=False)
-    elif chat_info['status'] == 'failed':
-        return utils.ResultDTO(code=400, message="실패한 대화입니다.", result=False)
-    
-    food_info_list = []
-    for fid in food_chat_info.data['food_ids']:
-        food_info = db.food.get_info(sid, fid)
-        food_info_list.append(food_info.data['food_info'])
-    
-    try:
-        food_chat_config(fcid, status='creating')
-        
-        client = OpenAI()
-        datetime_now = datetime.now()
-        
-        prompt = f'''선택된 식품 정보로 레시피 추천을 생성.
+# 레시피 캐시. 프롬프트는 식품의 (이름, 용량, 유형)과 식사 시간대로만 정해지므로 이 값들을 키로 사용
+recipe_cache = TTLCache(maxsize=int(os.environ.get('RECIPE_CACHE_SIZE', 1024)), ttl=float(os.environ.get('RECIPE_CACHE_TTL', 6 * 60 * 60)))
+
+# 프롬프트의 시간대 구분과 동일
+MEAL_SLOTS = (
+    (range(6, 11), 'breakfast'),
+    (range(11, 15), 'lunch'),
+    (range(15, 18), 'snack'),
+    (range(18, 22), 'dinner')
+)
+
+def get_meal_slot(hour: int) -> str:
+    for hours, meal_slot in MEAL_SLOTS:
+        if hour in hours:
+            return meal_slot
+    return 'late_night'
+
+def _normalize(value) -> str:
+    return ' '.join(str(value).split()).lower() if value is not None else ''
+
+def make_recipe_key(food_info_list: list, meal_slot: str) -> tuple:
+    return meal_slot, tuple(sorted((_normalize(food_info['name']), _normalize(food_info['volume']), _normalize(food_info['type'])) for food_info in food_info_list))
+
+# 같은 키로 동시에 들어온 생성 요청은 먼저 시작한 요청의 OpenAI 호출 하나를 공유
+# 나중에 합류한 대화도 지금까지의 출력부터 이어서 스트리밍 받음
+class RecipeFlight:
+    def __init__(self):
+        self.chunks = []
+        self.streams = []
+        self.output_text = None
+        self.error = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def join(self, stream: ChatStream):
+        with self._lock:
+            for chunk in self.chunks:
+                stream.publish(chunk)
+            self.streams.append(stream)
+
+    def publish(self, delta: str):
+        with self._lock:
+            self.chunks.append(delta)
+            streams = list(self.streams)
+        for stream in streams:
+            stream.publish(delta)
+
+class RecipeFlights:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'generations': 0,
+            'coalesced': 0
+        }
+
+    def generate(self, key: tuple, stream: ChatStream, request) -> tuple[str, int, int]:
+        # request(publish) -> (응답, 입력 토큰, 출력 토큰). 합류한 요청의 토큰 사용량은 0
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = RecipeFlight()
+            self._stats['generations' if leader else 'coalesced'] += 1
+        flight.join(stream)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.output_text, 0, 0
+
+        try:
+            output_text, input_tokens, output_tokens = request(flight.publish)
+            flight.output_text = output_text
+            # 진행 중 목록에서 빠지기 전에 캐시에 저장해야 이후 요청이 캐시를 사용
+            recipe_cache.set(key, output_text)
+            return output_text, input_tokens, output_tokens
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+        return stats
+
+recipe_flights = RecipeFlights()
+
+def _request_recipe(food_info_list: list, datetime_now: datetime, publish) -> tuple[str, int, int]:
+    prompt = f'''선택된 식품 정보로 레시피 추천을 생성.
         선택된 식품 정보로만 되도록 레시피를 생성하되, 레시피 생성이 어려울 경우 1~2개 정도는 선택된 식품 정보에 없는 식품 추가 가능.
         Markdown 형식이 아닌 일반 plain text로 응답.
         재료는 줄바꿈 리스트(- , - , - ) 형식으로 답해야 함.
@@ -228,25 +663,114 @@ def generate_chat(sid: str, fcid: str) -> utils.ResultDTO:
     <간단한 코멘트>
 
         선택된 식품 정보:'''
-        for food_info in food_info_list:
-            prompt += f"\n- {food_info['name']}(용량: {food_info['volume']}, 식품 유형: {food_info['type']})"
-        
-        response = client.responses.create(
-            model="gpt-4.1-nano",
-            input=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-            ],
-        )
+    for food_info in food_info_list:
+        prompt += f"\n- {food_info['name']}(용량: {food_info['volume']}, 식품 유형: {food_info['type']})"
+    
+    # 출력 토큰을 받는 대로 전달하고, 완료 시 전체 응답과 사용량 반환
+    return src.llm.backend.generate(prompt, publish)
+
+def generate_chat(uid: str, fcid: str, lease_owner: str) -> utils.ResultDTO:
+    # FoodChat.claim()으로 lease를 얻은(creating) 대화만 생성
+    food_chat_info = get_info(uid, fcid)
+    if not food_chat_info.result:
+        return food_chat_info
+    
+    chat_info = food_chat_info.data['chat_info']
+    if chat_info['status'] == 'creating' and chat_info['lease_owner'] != lease_owner:
+        return utils.ResultDTO(code=400, message="생성 중인 대화입니다.", result=False)
+    elif chat_info['status'] == 'completed':
+        return utils.ResultDTO(code=400, message="이미 완료된 대화입니다.", result=False)
+    elif chat_info['status'] == 'failed':
+        return utils.ResultDTO(code=400, message="실패한 대화입니다.", result=False)
+    elif chat_info['status'] != 'creating':
+        return utils.ResultDTO(code=400, message="대기 중인 대화입니다.", result=False)
+    
+    food_infos = db.food.get_many(uid, food_chat_info.data['food_ids'])
+    food_info_list = [result['food_info'] for result in food_infos.data['results'] if result['result']]
+    
+    datetime_now = datetime.now()
+    recipe_key = make_recipe_key(food_info_list, get_meal_slot(datetime_now.hour))
+    
+    stream = chat_streams.open(fcid)
+    try:
+        # 같은 재료와 식사 시간대의 레시피는 캐시된 응답을 사용(토큰 사용량 0)
+        output_text = recipe_cache.get(recipe_key)
+        if output_text is not None:
+            stream.publish(output_text)
+            input_tokens, output_tokens = 0, 0
+        else:
+            output_text, input_tokens, output_tokens = recipe_flights.generate(recipe_key, stream, lambda publish: _request_recipe(food_info_list, datetime_now, publish))
         
-        output_text = response.output_text
-        input_tokens = response.usage.input_tokens
-        output_tokens = response.usage.output_tokens
-        food_chat_config(fcid, status='completed', response=output_text, usage_input_tokens=input_tokens, usage_output_tokens=output_tokens)
+        # lease가 만료되어 다른 워커가 가져간 경우에는 결과를 반영하지 않음
+        config_result = food_chat_config(fcid, status='completed', response=output_text, usage_input_tokens=input_tokens, usage_output_tokens=output_tokens, lease_owner=lease_owner)
+        if not config_result.result:
+            stream.close('restarted')
+            return config_result
         
-        return utils.ResultDTO(code=200, message="대화가 성공적으로 생성되었습니다.", data=get_info(sid, fcid).data, result=True)
+        stream.close('completed')
+        return utils.ResultDTO(code=200, message="대화가 성공적으로 생성되었습니다.", data=get_info(uid, fcid).data, result=True)
     except Exception as e:
-        food_chat_config(fcid, status='failed') 
-        return utils.ResultDTO(code=500, message=f"대화 생성 중 오류가 발생했습니다: {str(e)}", result=False)
\ No newline at end of file
+        food_chat_config(fcid, status='failed', lease_owner=lease_owner)
+        stream.close('failed')
+        return utils.ResultDTO(code=500, message=f"대화 생성 중 오류가 발생했습니다: {str(e)}", result=False)
+
+def stream_chat(uid: str, fcid: str, heartbeat: float = 15, poll_interval: float = 1):
+    # (이벤트, 데이터) 반환. 요청 컨텍스트 밖에서 실행되므로 연결을 응답 내내 점유하지 않음
+    # 같은 프로세스에서 생성 중이면 토큰 단위로, 다른 프로세스에서 생성 중이면 DB 상태를 확인해 완료 시 한 번에 전달
+    streamed = False
+    restarted_stream = None
+    last_sent_at = time.monotonic()
+    while True:
+        stream = chat_streams.get(fcid)
+        if stream is not None and stream is not restarted_stream:
+            offset = 0
+            while True:
+                chunks, status = stream.wait(offset, heartbeat)
+                if chunks:
+                    offset += len(chunks)
+                    streamed = True
+                    yield 'delta', {'text': ''.join(chunks)}
+                elif status is None:
+                    yield 'ping', {}
+                if status is not None:
+                    break
+            if status != 'restarted':
+                break
+            restarted_stream = stream
+            if streamed:
+                streamed = False
+                yield 'reset', {}
+            continue
+        
+        food_chat_info = get_info(uid, fcid)
+        if not food_chat_info.result:
+            yield 'error', {'code': food_chat_info.code, 'message': food_chat_info.message}
+            return
+        if food_chat_info.data['chat_info']['status'] in ('completed', 'failed'):
+            break
+        if time.monotonic() - last_sent_at >= heartbeat:
+            last_sent_at = time.monotonic()
+            yield 'ping', {}
+        chat_streams.wait_for(fcid, poll_interval, exclude=restarted_stream)
+    
+    food_chat_info = get_info(uid, fcid)
+    chat_info = food_chat_info.data['chat_info']
+    if chat_info['status'] != 'completed':
+        yield 'error', {'code': 500, 'message': "대화 생성 중 오류가 발생했습니다."}
+        return
+    if not streamed and chat_info['response']:
+        yield 'delta', {'text': chat_info['response']}
+    yield 'completed', food_chat_info.data
+
+# 워커가 시작 직후 바로 generate_chat을 호출할 수 있도록 모듈 끝에서 생성
+foodchat_service = FoodChat(scheduler=FoodChatScheduler(user_concurrency=int(os.environ.get('FOOD_CHAT_USER_CONCURRENCY', 1)),
+                                                      global_concurrency=int(os.environ.get('FOOD_CHAT_GLOBAL_CONCURRENCY', 8)),
+                                                      user_max_pending=int(os.environ.get('FOOD_CHAT_USER_MAX_PENDING', 5)),
+                                                      tokens_per_minute=int(os.environ.get('FOOD_CHAT_TOKENS_PER_MINUTE', 200000)),
+                                                      tokens_per_generation=int(os.environ.get('FOOD_CHAT_TOKENS_PER_GENERATION', 1500)),
+                                                      generation_seconds=float(os.environ.get('FOOD_CHAT_GENERATION_SECONDS', 10))),
+                            workers=int(os.environ.get('FOOD_CHAT_WORKERS', 4)),
+                            shutdown_timeout=float(os.environ.get('FOOD_CHAT_SHUTDOWN_TIMEOUT', 30)),
+                            lease_seconds=float(os.environ.get('FOOD_CHAT_LEASE_SECONDS', 60)),
+                            poll_interval=float(os.environ.get('FOOD_CHAT_POLL_INTERVAL', 2)),
+                            max_attempts=int(os.environ.get('FOOD_CHAT_MAX_ATTEMPTS', 3)))
@@ -0,0 +1,199 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+import db
+import src.utils as utils
+
+# DB 테이블을 작업 큐로 사용하는 워커의 공통 부분. 재시작해도 작업이 유실되지 않음
+# 워커는 queued 상태의 작업을 lease와 함께 원자적으로 가져가고(leased_status), 처리 중인 작업의 lease만 주기적으로 연장
+# 처리를 끝내지 못한 채 lease가 만료된 작업(프로세스 종료, 상태 반영 실패 등)은 다시 queued로 돌려 여러 프로세스가 중복 없이 나눠 처리
+# 하위 클래스는 _worker()에서 작업을 가져와(claim) hold()로 등록하고, 끝나면 상태를 반영한 뒤 unhold()
+class LeaseQueue:
+    def __init__(self, name: str, table: str, id_column: str, leased_status: str, failed_status: str,
+                 workers: int, lease_seconds: float, poll_interval: float, shutdown_timeout: float, max_attempts: int):
+        self.name = name
+        self.table = table
+        self.id_column = id_column
+        self.leased_status = leased_status
+        self.failed_status = failed_status
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.max_attempts = max_attempts
+        self.lease_owner = f"{os.getpid()}-{utils.gen_hash(8)}"
+
+        # 같은 프로세스의 워커를 바로 깨우기 위한 신호. 다른 프로세스는 poll_interval마다 확인
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._held = set()
+        self._threads = []
+        self._stats = {
+            'claimed': 0,
+            'recovered': 0
+        }
+        # {이름: [합계(ms), 최대(ms), 횟수]}
+        self._timings = {}
+
+    def start(self):
+        # 시작 시 lease가 만료된 작업부터 복구
+        self.recover_expired()
+        self._threads = [threading.Thread(target=self._worker, name=f'{self.name}-{index}', daemon=True) for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        threading.Thread(target=self._lease_thread, daemon=True).start()
+        atexit.register(self.shutdown)
+
+    def _worker(self):
+        raise NotImplementedError
+
+    def hold(self, ids: list):
+        with self._lock:
+            self._stats['claimed'] += len(ids)
+            self._held.update(ids)
+
+    def unhold(self, ids: list):
+        # 더 이상 lease를 연장하지 않음. 상태를 반영하지 못한 작업은 lease 만료 후 recover_expired에서 처리
+        with self._lock:
+            self._held.difference_update(ids)
+
+    def wait(self, timeout: float):
+        try:
+            self._queue.get(timeout=timeout)
+        except queue.Empty:
+            pass
+
+    def notify(self, count: int = 1):
+        for _ in range(min(count, self.workers)):
+            self._queue.put(True)
+
+    def record(self, key: str, value_ms: float):
+        with self._lock:
+            timing = self._timings.setdefault(key, [0.0, 0.0, 0])
+            timing[0] += value_ms
+            timing[1] = max(timing[1], value_ms)
+            timing[2] += 1
+
+    def count(self, key: str, value: int = 1):
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + value
+
+    def _renew_leases(self):
+        with self._lock:
+            ids = list(self._held)
+        if not ids:
+            return
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            placeholders = ', '.join('?' * len(ids))
+            cursor.execute(f"""UPDATE {self.table} SET lease_expires_at = datetime('now', '+9 hours', ?)
+                           WHERE {self.id_column} IN ({placeholders}) AND lease_owner = ?""", (f"+{self.lease_seconds} seconds", *ids, self.lease_owner))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Failed to renew {self.name} leases: {e}")
+        finally:
+            db.close_db_connection(conn)
+
+    def recover_expired(self) -> int:
+        # lease가 만료된 작업은 다시 대기열로. 재시도 횟수를 넘으면 실패 처리
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""UPDATE {self.table} SET status = CASE WHEN attempts >= ? THEN '{self.failed_status}' ELSE 'queued' END,
+                           lease_owner = NULL, lease_expires_at = NULL, updated_at = datetime('now', '+9 hours')
+                           WHERE status = '{self.leased_status}' AND lease_expires_at < datetime('now', '+9 hours')""", (self.max_attempts,))
+            recovered = cursor.rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Failed to recover {self.name} jobs: {e}")
+            recovered = 0
+        finally:
+            db.close_db_connection(conn)
+
+        if recovered:
+            self.count('recovered', recovered)
+            self.notify(recovered)
+        return recovered
+
+    def requeue_unfinished(self, id_value) -> str | None:
+        # 아직 이 워커가 처리 중인 작업이면 다시 대기열로(재시도 횟수를 넘으면 실패). 변경된 상태 반환
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""UPDATE {self.table} SET status = CASE WHEN attempts >= ? THEN '{self.failed_status}' ELSE 'queued' END,
+                           lease_owner = NULL, lease_expires_at = NULL, updated_at = datetime('now', '+9 hours')
+                           WHERE {self.id_column} = ? AND status = '{self.leased_status}' AND lease_owner = ? RETURNING status""",
+                           (self.max_attempts, id_value, self.lease_owner))
+            row = cursor.fetchone()
+            conn.commit()
+        finally:
+            db.close_db_connection(conn)
+
+        if row is not None and row['status'] == 'queued':
+            self.notify()
+        return row['status'] if row else None
+
+    def release(self, ids: list) -> int:
+        # 가져갔지만 처리하지 않은 작업을 재시도 횟수를 되돌려 대기열로 반환
+        if not ids:
+            return 0
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            placeholders = ', '.join('?' * len(ids))
+            cursor.execute(f"""UPDATE {self.table} SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, attempts = attempts - 1,
+                           updated_at = datetime('now', '+9 hours') WHERE {self.id_column} IN ({placeholders}) AND lease_owner = ?""", (*ids, self.lease_owner))
+            released = cursor.rowcount
+            conn.commit()
+        finally:
+            db.close_db_connection(conn)
+        self.unhold(ids)
+        return released
+
+    def _release_all(self):
+        # 종료 시 끝내지 못한 작업은 다른 프로세스가 바로 가져갈 수 있도록 반환
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""UPDATE {self.table} SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, attempts = attempts - 1,
+                           updated_at = datetime('now', '+9 hours') WHERE status = '{self.leased_status}' AND lease_owner = ?""", (self.lease_owner,))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Failed to release {self.name} leases: {e}")
+        finally:
+            db.close_db_connection(conn)
+
+    def _lease_thread(self):
+        while not self._stop_event.wait(self.lease_seconds / 3):
+            self._renew_leases()
+            self.recover_expired()
+
+    def shutdown(self):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        # 대기 중인 워커를 깨우고, 진행 중인 작업은 shutdown_timeout까지 기다린 뒤 남은 lease 반환
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + self.shutdown_timeout
+        for thread in self._threads:
+            thread.join(timeout=max(0, deadline - time.monotonic()))
+        self._release_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['held'] = len(self._held)
+            timings = {key: list(timing) for key, timing in self._timings.items()}
+        stats['workers'] = self.workers
+        stats['lease_owner'] = self.lease_owner
+        for key, (total_ms, max_ms, count) in timings.items():
+            stats[f'{key}_total_ms'] = round(total_ms, 2)
+            stats[f'{key}_max_ms'] = round(max_ms, 2)
+            stats[f'{key}_avg_ms'] = round(total_ms / count, 2) if count else 0.0
+        return stats
@@ -0,0 +1,367 @@
+import ast
+import os
+import re
+import sqlite3
+import sys
+
+# (버전, SQL) 목록. 새 스키마 변경은 항상 마지막에 다음 버전으로 추가
+MIGRATIONS = [
+    (1, '''
+        CREATE TABLE IF NOT EXISTS email_verification (
+            email TEXT PRIMARY KEY,
+            verification_code TEXT NOT NULL,
+            is_verified BOOLEAN NOT NULL DEFAULT 0,
+            try_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours'))
+        );
+        
+        CREATE TABLE IF NOT EXISTS users (
+            uid TEXT PRIMARY KEY,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            salt TEXT NOT NULL,
+            name TEXT NOT NULL,
+            profile_url TEXT DEFAULT NULL,
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            FOREIGN KEY (email) REFERENCES email_verification(email)
+        );
+        
+        CREATE TABLE IF NOT EXISTS user_password_find_link (
+            email TEXT NOT NULL,
+            link_hash TEXT NOT NULL,
+            is_used BOOLEAN NOT NULL DEFAULT FALSE,
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
+            update_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            
+            FOREIGN KEY (email) REFERENCES email_verification(email)
+        );
+
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            sid TEXT PRIMARY KEY,
+            uid TEXT NOT NULL,
+            user_agent TEXT NOT NULL,
+            ip_address TEXT NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            last_accessed TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            update_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            expires_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            FOREIGN KEY (uid) REFERENCES users(uid)
+        );
+        
+        CREATE TABLE IF NOT EXISTS user_session_deactive_link (
+            sid TEXT PRIMARY KEY,
+            link_hash TEXT NOT NULL,
+            is_used BOOLEAN NOT NULL DEFAULT FALSE,
+            update_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+
+            FOREIGN KEY (sid) REFERENCES user_sessions(sid)
+        );
+
+        CREATE TABLE IF NOT EXISTS foods (
+            fid TEXT PRIMARY KEY,
+            uid TEXT NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            ingredients TEXT DEFAULT '정보없음',
+            description TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            volume TEXT DEFAULT NULL,
+            image_url TEXT DEFAULT NULL,
+            barcode TEXT NOT NULL,
+            expiration_date_desc TEXT,
+            expiration_date DATE NOT NULL,
+            updated_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            FOREIGN KEY (uid) REFERENCES users(uid)
+        );
+
+        CREATE TABLE IF NOT EXISTS food_chat (
+            fcid TEXT PRIMARY KEY,
+            uid TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'created',
+            response TEXT DEFAULT NULL,
+            usage_input_token INTEGER NOT NULL DEFAULT 0,
+            usage_output_token INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            updated_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            FOREIGN KEY (uid) REFERENCES users(uid)
+        );
+        CREATE TABLE IF NOT EXISTS food_chat_items (
+            fcid TEXT NOT NULL,
+            fid TEXT NOT NULL,
+            FOREIGN KEY (fcid) REFERENCES food_chat(fcid),
+            FOREIGN KEY (fid) REFERENCES foods(fid),
+            PRIMARY KEY (fcid, fid)
+        );
+    '''),
+    (2, '''
+        CREATE INDEX IF NOT EXISTS idx_foods_uid_active_expiration ON foods (uid, is_active, expiration_date);
+        CREATE INDEX IF NOT EXISTS idx_user_sessions_uid_created ON user_sessions (uid, created_at);
+        CREATE INDEX IF NOT EXISTS idx_food_chat_uid ON food_chat (uid);
+        CREATE INDEX IF NOT EXISTS idx_session_deactive_link_hash ON user_session_deactive_link (link_hash);
+        CREATE INDEX IF NOT EXISTS idx_password_find_link_email ON user_password_find_link (email, is_used, created_at);
+        CREATE INDEX IF NOT EXISTS idx_password_find_link_hash ON user_password_find_link (link_hash);
+    '''),
+    (3, '''
+        CREATE INDEX IF NOT EXISTS idx_user_sessions_active_update ON user_sessions (is_active, update_at);
+    '''),
+    (4, '''
+        CREATE TABLE IF NOT EXISTS barcode_products (
+            barcode TEXT PRIMARY KEY,
+            is_found BOOLEAN NOT NULL DEFAULT 1,
+            name TEXT DEFAULT NULL,
+            type TEXT DEFAULT NULL,
+            pog_daycnt TEXT DEFAULT NULL,
+            volume TEXT DEFAULT NULL,
+            image_url TEXT DEFAULT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours'))
+        );
+    '''),
+    (5, '''
+        CREATE INDEX IF NOT EXISTS idx_foods_uid_active_expiration_fid ON foods (uid, is_active, expiration_date, fid);
+        DROP INDEX IF EXISTS idx_foods_uid_active_expiration;
+    '''),
+    (6, '''
+        CREATE INDEX IF NOT EXISTS idx_foods_uid_updated_fid ON foods (uid, updated_at, fid);
+    '''),
+    (7, '''
+        ALTER TABLE food_chat ADD COLUMN lease_owner TEXT DEFAULT NULL;
+        ALTER TABLE food_chat ADD COLUMN lease_expires_at TIMESTAMP DEFAULT NULL;
+        ALTER TABLE food_chat ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+        -- 메모리 큐를 쓰던 이전 버전에서 처리 중 중단된 대화는 다시 대기 상태로
+        UPDATE food_chat SET status = 'queued' WHERE status = 'creating';
+        CREATE INDEX IF NOT EXISTS idx_food_chat_status_created ON food_chat (status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_food_chat_status_lease ON food_chat (status, lease_expires_at);
+    '''),
+    (8, '''
+        CREATE INDEX IF NOT EXISTS idx_food_chat_status_updated ON food_chat (status, updated_at);
+    '''),
+    (9, '''
+        CREATE INDEX IF NOT EXISTS idx_food_chat_uid_created_fcid ON food_chat (uid, created_at, fcid);
+        DROP INDEX IF EXISTS idx_food_chat_uid;
+    '''),
+    (10, '''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            eid INTEGER PRIMARY KEY AUTOINCREMENT,
+            receiver_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            plain TEXT NOT NULL,
+            html TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            lease_owner TEXT DEFAULT NULL,
+            lease_expires_at TIMESTAMP DEFAULT NULL,
+            last_error TEXT DEFAULT NULL,
+            created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+            updated_at TIMESTAMP DEFAULT (datetime('now', '+9 hours'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_status_priority_next ON email_outbox (status, priority, next_attempt_at);
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_status_lease ON email_outbox (status, lease_expires_at);
+    '''),
+    (11, '''
+        -- 삭제된 식품까지 포함한 목록(active_only=0)도 정렬 없이 keyset 페이지네이션
+        CREATE INDEX IF NOT EXISTS idx_foods_uid_expiration_fid ON foods (uid, expiration_date, fid);
+    '''),
+]
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _split_statements(script: str) -> list:
+    # executescript는 진행 중인 트랜잭션을 먼저 커밋하므로, 잠근 트랜잭션 안에서 실행하도록 문장 단위로 나눔
+    statements, buffer = [], ''
+    for part in script.split(';'):
+        buffer += part + ';'
+        if sqlite3.complete_statement(buffer):
+            if buffer.strip(' \n;'):
+                statements.append(buffer)
+            buffer = ''
+    return statements
+
+def migrate(conn: sqlite3.Connection) -> int:
+    # 현재 버전 이후의 마이그레이션만 순서대로 적용. 각 버전은 하나의 트랜잭션으로 처리
+    # 여러 프로세스가 동시에 시작할 수 있으므로 BEGIN IMMEDIATE로 쓰기 잠금을 잡은 뒤 버전을 다시 읽고, 이미 적용된 버전은 건너뜀
+    current = get_version(conn)
+    for version, script in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            current = get_version(conn)
+            if version > current:
+                for statement in _split_statements(script):
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+                current = version
+            conn.commit()
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    return current
+
+# 쿼리 실행 계획 검사
+# db/*.py 안의 SQL 문자열을 모두 찾아 EXPLAIN QUERY PLAN으로 full scan, 정렬용 임시 B-tree 사용 여부 확인
+# 의도적인 full scan, 정렬은 해당 줄이나 바로 윗줄에 ALLOW_SCAN_MARKER, ALLOW_SORT_MARKER 주석을 달아 제외
+SQL_RE = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+# 인덱스를 순회하는 SCAN ... USING (COVERING) INDEX도 테이블 전체를 읽으므로 실패. 인덱스로 범위를 좁히는 SEARCH만 통과
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)')
+TEMP_SORT_RE = re.compile(r'^USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+NAMED_PARAM_RE = re.compile(r'(?<![:\w]):(\w+)')
+ALLOW_SCAN_MARKER = 'query-plan: allow-scan'
+ALLOW_SORT_MARKER = 'query-plan: allow-sort'
+
+# f-string으로 조립하는 쿼리는 그대로 검사할 수 없으므로 (파일, 함수)별로 실제로 만들어지는 대표 형태를 검사
+# 새 동적 쿼리를 추가하면 여기에도 예시를 추가해야 검사를 통과함
+DYNAMIC_QUERY_SAMPLES = {
+    ('food.py', 'get_many'): [
+        "SELECT * FROM foods WHERE fid IN (?, ?)",
+    ],
+    ('food.py', 'get_list_info'): [
+        "SELECT * FROM foods WHERE uid = :uid AND is_active = 1 ORDER BY expiration_date ASC, fid ASC LIMIT :limit",
+        """SELECT * FROM foods WHERE uid = :uid AND is_active = 1 AND (expiration_date, fid) > (:cursor_expiration_date, :cursor_fid)
+           ORDER BY expiration_date ASC, fid ASC LIMIT :limit""",
+        """SELECT * FROM foods WHERE uid = :uid AND is_active = 1 AND (expiration_date, fid) < (:cursor_expiration_date, :cursor_fid)
+           ORDER BY expiration_date DESC, fid DESC LIMIT :limit""",
+        """SELECT * FROM foods WHERE uid = :uid AND is_active = 1 AND type = :type AND expiration_date <= :expiring_before
+           ORDER BY expiration_date ASC, fid ASC LIMIT :limit""",
+        "SELECT * FROM foods WHERE uid = :uid ORDER BY expiration_date ASC, fid ASC LIMIT :limit",
+        """SELECT * FROM foods WHERE uid = :uid AND (expiration_date, fid) < (:cursor_expiration_date, :cursor_fid)
+           ORDER BY expiration_date DESC, fid DESC LIMIT :limit""",
+    ],
+    ('food.py', 'get_changes'): [
+        "SELECT * FROM foods WHERE uid = :uid AND (updated_at, fid) > (:since_updated_at, :since_fid) ORDER BY updated_at, fid LIMIT :limit",
+    ],
+    ('food.py', 'regi_foods_with_barcodes'): [
+        "SELECT * FROM foods WHERE uid = ? AND fid IN (?, ?)",
+    ],
+    ('food_chat.py', 'get_list_info'): [
+        """SELECT fcid, uid, status, response AS response, created_at,
+           (SELECT group_concat(fid) FROM food_chat_items WHERE food_chat_items.fcid = food_chat.fcid) AS food_ids
+           FROM food_chat WHERE uid = :uid ORDER BY created_at ASC, fcid ASC LIMIT :limit""",
+        """SELECT fcid, uid, status, substr(response, 1, :preview_length) AS response, created_at,
+           (SELECT group_concat(fid) FROM food_chat_items WHERE food_chat_items.fcid = food_chat.fcid) AS food_ids
+           FROM food_chat WHERE uid = :uid AND (created_at, fcid) < (:cursor_created_at, :cursor_fcid)
+           ORDER BY created_at DESC, fcid DESC LIMIT :limit""",
+    ],
+    ('food_chat.py', 'food_chat_config'): [
+        "UPDATE food_chat SET status = ?, response = ?, updated_at = datetime('now', '+9 hours') WHERE fcid = ? AND lease_owner = ?",
+    ],
+    ('lease_queue.py', '_renew_leases'): [
+        "UPDATE food_chat SET lease_expires_at = datetime('now', '+9 hours', ?) WHERE fcid IN (?, ?) AND lease_owner = ?",
+        "UPDATE email_outbox SET lease_expires_at = datetime('now', '+9 hours', ?) WHERE eid IN (?, ?) AND lease_owner = ?",
+    ],
+    ('lease_queue.py', 'recover_expired'): [
+        """UPDATE food_chat SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+           lease_owner = NULL, lease_expires_at = NULL, updated_at = datetime('now', '+9 hours')
+           WHERE status = 'creating' AND lease_expires_at < datetime('now', '+9 hours')""",
+        """UPDATE email_outbox SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'queued' END,
+           lease_owner = NULL, lease_expires_at = NULL, updated_at = datetime('now', '+9 hours')
+           WHERE status = 'sending' AND lease_expires_at < datetime('now', '+9 hours')""",
+    ],
+    ('lease_queue.py', 'requeue_unfinished'): [
+        """UPDATE food_chat SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+           lease_owner = NULL, lease_expires_at = NULL, updated_at = datetime('now', '+9 hours')
+           WHERE fcid = ? AND status = 'creating' AND lease_owner = ? RETURNING status""",
+        """UPDATE email_outbox SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'queued' END,
+           lease_owner = NULL, lease_expires_at = NULL, updated_at = datetime('now', '+9 hours')
+           WHERE eid = ? AND status = 'sending' AND lease_owner = ? RETURNING status""",
+    ],
+    ('lease_queue.py', 'release'): [
+        """UPDATE food_chat SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, attempts = attempts - 1,
+           updated_at = datetime('now', '+9 hours') WHERE fcid IN (?, ?) AND lease_owner = ?""",
+        """UPDATE email_outbox SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, attempts = attempts - 1,
+           updated_at = datetime('now', '+9 hours') WHERE eid IN (?, ?) AND lease_owner = ?""",
+    ],
+    ('lease_queue.py', '_release_all'): [
+        """UPDATE food_chat SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, attempts = attempts - 1,
+           updated_at = datetime('now', '+9 hours') WHERE status = 'creating' AND lease_owner = ?""",
+        """UPDATE email_outbox SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, attempts = attempts - 1,
+           updated_at = datetime('now', '+9 hours') WHERE status = 'sending' AND lease_owner = ?""",
+    ],
+    ('product.py', 'get_cached_products'): [
+        "SELECT * FROM barcode_products WHERE barcode IN (?, ?) AND expires_at > ?",
+    ],
+}
+
+def _iter_queries(path: str):
+    # (줄 번호, SQL, None, 정렬 허용 여부). f-string 쿼리는 (줄 번호, None, 함수 이름, False)
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    lines = source.splitlines()
+    tree = ast.parse(source)
+    functions = {id(child): node.name for node in ast.walk(tree) if isinstance(node, ast.FunctionDef) for child in ast.walk(node)}
+    # f-string 조각은 완전한 SQL이 아니므로 f-string 전체를 동적 쿼리로 처리
+    fstring_parts = {id(value) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for value in node.values}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.JoinedStr):
+            head = node.values[0] if node.values else None
+            if isinstance(head, ast.Constant) and SQL_RE.match(head.value):
+                yield node.lineno, None, functions.get(id(node)), False
+            continue
+        if id(node) in fstring_parts:
+            continue
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and SQL_RE.match(node.value):
+            context = '\n'.join(lines[max(0, node.lineno - 2):node.lineno])
+            if ALLOW_SCAN_MARKER in context:
+                continue
+            yield node.lineno, node.value, None, ALLOW_SORT_MARKER in context
+
+def _check_plan(conn: sqlite3.Connection, tables: set, sql: str, allow_sort: bool = False) -> list:
+    names = NAMED_PARAM_RE.findall(sql)
+    params = dict.fromkeys(names) if names else [None] * sql.count('?')
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as e:
+        return [f"실행 계획 조회 실패: {e}"]
+    details = []
+    for row in plan:
+        # CTE, 서브쿼리 결과를 순회하는 SCAN은 테이블 전체 스캔이 아니므로 제외
+        match = FULL_SCAN_RE.match(row[3])
+        if (match and match.group(1) in tables) or (not allow_sort and TEMP_SORT_RE.match(row[3])):
+            details.append(row[3])
+    return details
+
+def check_query_plans(db_dir: str = os.path.dirname(__file__)) -> list:
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    problems = []
+    for name in sorted(os.listdir(db_dir)):
+        # 이 파일의 SQL은 마이그레이션과 위의 예시뿐이므로 제외
+        if not name.endswith('.py') or name == os.path.basename(__file__):
+            continue
+        path = os.path.join(db_dir, name)
+        for lineno, sql, function, allow_sort in _iter_queries(path):
+            if sql is None:
+                if (name, function) not in DYNAMIC_QUERY_SAMPLES:
+                    problems.append((f"{name}:{lineno}", '', f"DYNAMIC_QUERY_SAMPLES에 ('{name}', '{function}')의 예시가 없습니다."))
+                continue
+            for detail in _check_plan(conn, tables, sql, allow_sort):
+                problems.append((f"{name}:{lineno}", sql, detail))
+
+    for (name, function), samples in DYNAMIC_QUERY_SAMPLES.items():
+        for sql in samples:
+            for detail in _check_plan(conn, tables, sql):
+                problems.append((f"{name}:{function}", sql, detail))
+
+    conn.close()
+    return problems
+
+if __name__ == '__main__':
+    problems = check_query_plans()
+    for location, sql, detail in problems:
+        print(f"[QUERY PLAN] {location}: {detail}\n    {' '.join(sql.split())}")
+    if problems:
+        sys.exit(1)
+    print("모든 쿼리가 인덱스를 사용합니다.")
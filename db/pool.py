@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+
+class ConnectionPool:
+    def __init__(self, database: str, max_idle: int = 8, cached_statements: int = 256,
+                 cache_size_kb: int = 16384, mmap_size: int = 128 * 1024 * 1024, busy_timeout_ms: int = 5000):
+        self.database = database
+        self.max_idle = max_idle
+        self.cached_statements = cached_statements
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'released': 0,
+            'discarded': 0,
+            'in_use': 0
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        # 연결 생성 시 한 번만 PRAGMA 적용. 이후 재사용 시에는 그대로 사용
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout_ms / 1000,
+                               cached_statements=self.cached_statements, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+                self._stats['reused'] += 1
+                self._stats['in_use'] += 1
+                return conn
+            self._stats['created'] += 1
+            self._stats['in_use'] += 1
+        return self._connect()
+
+    def release(self, conn: sqlite3.Connection):
+        # 커밋되지 않은 변경사항은 기존 close()와 동일하게 버림
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            self._stats['in_use'] -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                self._stats['released'] += 1
+                return
+            self._stats['discarded'] += 1
+        conn.close()
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._stats['in_use'] -= 1
+            self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        acquired = stats['created'] + stats['reused']
+        stats['reuse_rate'] = round(stats['reused'] / acquired, 4) if acquired else 0.0
+        return stats
@@ -0,0 +1,169 @@
+import os
+import time
+import db
+import src.utils as utils
+import requests
+from concurrent.futures import FIRST_COMPLETED, wait
+from src.upstream import Upstream, UpstreamUnavailable, executor
+from dotenv import load_dotenv
+load_dotenv()
+
+# 바코드 상품 정보 캐시. 외부 API(식품안전나라 C005, retaildb) 결과를 바코드 단위로 저장
+# 두 API 모두 모르는 바코드는 짧은 TTL로 음성 캐싱
+PRODUCT_CACHE_TTL_HOURS = float(os.environ.get('PRODUCT_CACHE_TTL_HOURS', 24 * 7))
+PRODUCT_NEGATIVE_CACHE_TTL_HOURS = float(os.environ.get('PRODUCT_NEGATIVE_CACHE_TTL_HOURS', 6))
+PRODUCT_LOOKUP_TIMEOUT = float(os.environ.get('PRODUCT_LOOKUP_TIMEOUT', 6))
+# 기본값은 일괄 등록 최대 개수(db.food.FOOD_BULK_MAX_ITEMS = 30) x API 2개. 최대 크기의 일괄 등록도 한 번에 모두 조회해 지연이 PRODUCT_LOOKUP_TIMEOUT 한 번으로 끝남
+PRODUCT_LOOKUP_MAX_INFLIGHT = max(1, int(os.environ.get('PRODUCT_LOOKUP_MAX_INFLIGHT', 60)))
+
+foodsafety_upstream = Upstream('foodsafetykorea', timeout=float(os.environ.get('FOODSAFETY_API_TIMEOUT', 3)))
+# retaildb는 인증서 검증에 실패하는 경우가 있어 기존과 같이 기본값은 검증하지 않음
+retaildb_upstream = Upstream('retaildb', timeout=float(os.environ.get('RETAILDB_API_TIMEOUT', 3)),
+                             verify=os.environ.get('RETAILDB_VERIFY_SSL', 'false').lower() == 'true')
+
+def _empty_product(barcode: str) -> dict:
+    return {
+        'barcode': barcode,
+        'is_found': False,
+        'name': None,
+        'type': "정보 없음",
+        'pog_daycnt': None,
+        'volume': None,
+        'image_url': None
+    }
+
+def _fetch_foodsafety(barcode: str) -> tuple[dict, bool]:
+    # 식품안전나라 C005: 이름, 식품 유형, 유통기한
+    product = {}
+    try:
+        response = foodsafety_upstream.get(f"http://openapi.foodsafetykorea.go.kr/api/{os.environ['FOODSAFETYKOREA_API_KEY']}/C005/json/1/100/BAR_CD={barcode}")
+        response_json = response.json()
+    except (requests.RequestException, UpstreamUnavailable, ValueError):
+        return product, False
+
+    # INFO-200: 해당하는 데이터 없음. 그 외 오류 코드(인증키 오류 등)는 캐싱하지 않음
+    result = response_json.get('C005') or {}
+    if 'row' not in result:
+        return product, result.get('RESULT', {}).get('CODE') == 'INFO-200'
+    try:
+        row = result['row'][0]
+        product['name'] = row['PRDLST_NM']
+        product['type'] = row['PRDLST_DCNM']
+        product['pog_daycnt'] = row['POG_DAYCNT']
+    except (KeyError, IndexError, TypeError):
+        pass
+    return product, True
+
+def _fetch_retaildb(barcode: str) -> tuple[dict, bool]:
+    # retaildb: 이름, 용량, 이미지
+    product = {}
+    try:
+        response = retaildb_upstream.get(f"https://www.retaildb.or.kr/service/product_info/search/{barcode}")
+    except (requests.RequestException, UpstreamUnavailable):
+        return product, False
+
+    try:
+        response_json = response.json()
+        product['name'] = response_json['baseItems'][0]['value']
+        product['volume'] = response_json['originVolume']
+        product['image_url'] = response_json['images'][0]
+    except (ValueError, KeyError, IndexError, TypeError):
+        pass
+    return product, True
+
+def _fetch_products(barcodes: list) -> dict:
+    # {바코드: (상품 정보, 두 API 모두 응답했는지 여부)} 반환
+    # 한 요청이 공용 스레드 풀을 독차지하지 않도록 동시에 PRODUCT_LOOKUP_MAX_INFLIGHT개까지만 실행하고, 끝나는 대로 다음 호출을 시작
+    # PRODUCT_LOOKUP_TIMEOUT이 지나면 시작하지 못한 호출은 취소하고 응답을 받지 못한 것으로 처리(캐싱하지 않음)
+    tasks = iter([(barcode, index, fetch) for barcode in barcodes for index, fetch in enumerate((_fetch_foodsafety, _fetch_retaildb))])
+    answers = {barcode: [None, None] for barcode in barcodes}
+    deadline = time.monotonic() + PRODUCT_LOOKUP_TIMEOUT
+
+    pending = {}
+    try:
+        while True:
+            while len(pending) < PRODUCT_LOOKUP_MAX_INFLIGHT:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending[executor.submit(task[2], task[0])] = task
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                barcode, index, _ = pending.pop(future)
+                answers[barcode][index] = future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+    results = {}
+    for barcode, barcode_answers in answers.items():
+        product = _empty_product(barcode)
+        complete = True
+        # retaildb의 이름이 C005보다 우선하므로 순서대로 반영
+        for answer in barcode_answers:
+            partial, answered = answer or ({}, False)
+            product.update(partial)
+            complete = complete and answered
+        product['is_found'] = product['name'] is not None
+        results[barcode] = (product, complete)
+    return results
+
+def get_cached_products(barcodes: list) -> dict:
+    if not barcodes:
+        return {}
+
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+
+    placeholders = ', '.join('?' * len(barcodes))
+    cursor.execute(f"SELECT * FROM barcode_products WHERE barcode IN ({placeholders}) AND expires_at > ?", (*barcodes, utils.get_current_datetime_str()))
+    rows = cursor.fetchall()
+
+    db.close_db_connection(conn)
+
+    products = {}
+    for row in rows:
+        product = dict(row)
+        product['is_found'] = bool(product['is_found'])
+        products[product['barcode']] = product
+    return products
+
+def save_products(products: list):
+    if not products:
+        return
+
+    params = []
+    for product in products:
+        ttl_hours = PRODUCT_CACHE_TTL_HOURS if product['is_found'] else PRODUCT_NEGATIVE_CACHE_TTL_HOURS
+        params.append((product['barcode'], product['is_found'], product['name'], product['type'], product['pog_daycnt'],
+                       product['volume'], product['image_url'], utils.get_future_timestamp(hours=ttl_hours)))
+
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.executemany('''INSERT INTO barcode_products (barcode, is_found, name, type, pog_daycnt, volume, image_url, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(barcode) DO UPDATE SET is_found = excluded.is_found, name = excluded.name, type = excluded.type, pog_daycnt = excluded.pog_daycnt,
+                   volume = excluded.volume, image_url = excluded.image_url, expires_at = excluded.expires_at, updated_at = datetime('now', '+9 hours')''', params)
+    conn.commit()
+    db.close_db_connection(conn)
+
+def get_products(barcodes: list) -> dict:
+    # 캐시는 한 번의 쿼리로 조회하고, 캐시에 없는 바코드만 외부 API로 동시에 조회
+    barcodes = list(dict.fromkeys(barcodes))
+    # is_complete: 캐시 또는 두 API의 응답으로 확정된 정보인지 여부. False면 잠시 후 다시 조회하면 찾을 수 있음
+    products = get_cached_products(barcodes)
+    for product in products.values():
+        product['is_complete'] = True
+
+    missing = [barcode for barcode in barcodes if barcode not in products]
+    fetched = _fetch_products(missing)
+    for barcode, (product, complete) in fetched.items():
+        products[barcode] = dict(product, is_complete=complete)
+    save_products([product for product, complete in fetched.values() if complete])
+    return products
+
+def get_product(barcode: str) -> dict:
+    return get_products([barcode])[barcode]
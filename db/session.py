@@ -1,27 +1,223 @@
+import atexit
+import os
 import sqlite3
+import threading
+import time
+from dataclasses import dataclass
 import db
 import db.user
 import src.utils as utils
 import src.email
+import src.session_token as session_token
+from src.cache import TTLCache
+
+# 세션 조회 캐시. 세션 비활성화 시 invalidate_sessions로 반드시 무효화
+session_cache = TTLCache(maxsize=int(os.environ.get('SESSION_CACHE_SIZE', 4096)), ttl=float(os.environ.get('SESSION_CACHE_TTL', 30)))
+
+# 서명 토큰 모드에서 폐기(로그아웃)된 세션 목록 {sid: expires_at}
+# 시작 시 DB에서 다시 만들고, 다른 프로세스의 로그아웃은 주기적으로 동기화
+revoked_sessions = {}
+_revocation_lock = threading.Lock()
+_revocation_state = {'cursor': None, 'synced_at': 0.0}
+REVOCATION_SYNC_INTERVAL = float(os.environ.get('SESSION_REVOCATION_SYNC_INTERVAL', 5))
+
+def _add_revoked(rows):
+    with _revocation_lock:
+        for row in rows:
+            revoked_sessions[row['sid']] = row['expires_at']
+            if row['update_at'] and (_revocation_state['cursor'] is None or row['update_at'] > _revocation_state['cursor']):
+                _revocation_state['cursor'] = row['update_at']
+
+def load_revoked_sessions():
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT sid, expires_at, update_at FROM user_sessions WHERE is_active = 0 AND expires_at > ?", (utils.get_current_datetime_str(),))
+    rows = cursor.fetchall()
+
+    db.close_db_connection(conn)
+    with _revocation_lock:
+        revoked_sessions.clear()
+        _revocation_state['cursor'] = None
+        _revocation_state['synced_at'] = time.monotonic()
+    _add_revoked(rows)
+
+def sync_revoked_sessions():
+    now = time.monotonic()
+    with _revocation_lock:
+        if now - _revocation_state['synced_at'] < REVOCATION_SYNC_INTERVAL:
+            return
+        _revocation_state['synced_at'] = now
+        since = _revocation_state['cursor'] or '0000-00-00 00:00:00'
+        # 만료된 세션은 토큰 자체가 만료되므로 목록에서 제거
+        current = utils.get_current_datetime_str()
+        for sid in [sid for sid, expires_at in revoked_sessions.items() if expires_at <= current]:
+            del revoked_sessions[sid]
+
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT sid, expires_at, update_at FROM user_sessions WHERE is_active = 0 AND update_at >= ?", (since,))
+    rows = cursor.fetchall()
+
+    db.close_db_connection(conn)
+    _add_revoked(rows)
+
+def _revoke_sessions(sid: str = None, uid: str = None):
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+
+    if sid is not None:
+        cursor.execute("SELECT sid, expires_at, update_at FROM user_sessions WHERE sid = ?", (sid,))
+        _add_revoked(cursor.fetchall())
+    if uid is not None:
+        cursor.execute("SELECT sid, expires_at, update_at FROM user_sessions WHERE uid = ? AND is_active = 0", (uid,))
+        _add_revoked(cursor.fetchall())
+
+    db.close_db_connection(conn)
+
+def invalidate_sessions(sid: str = None, uid: str = None):
+    def _invalidate():
+        if sid is not None:
+            session_cache.invalidate(sid)
+        if uid is not None:
+            session_cache.invalidate_if(lambda key, value: value['uid'] == uid)
+    # 커밋 전 다른 요청이 이전 값을 다시 캐싱할 수 있으므로 커밋 후 한 번 더 무효화
+    _invalidate()
+    db.on_commit(_invalidate)
+
+    # 폐기 목록은 커밋된 세션 상태(is_active = 0)를 읽어야 하므로 커밋 후에 갱신
+    if session_token.is_enabled():
+        db.on_commit(lambda: _revoke_sessions(sid=sid, uid=uid))
+
+# 세션 마지막 접근 시간 기록(write-behind)
+# 요청마다 UPDATE하지 않고 메모리에 모아 두었다가 주기적으로 한 번에 반영
+class SessionAccessTracker:
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._stats = {
+            'touched': 0,
+            'flushes': 0,
+            'flushed_rows': 0,
+            'failures': 0
+        }
+
+        def flush_thread():
+            while not self._stop_event.wait(self.flush_interval):
+                self.flush()
+
+        threading.Thread(target=flush_thread, daemon=True).start()
+        atexit.register(self.shutdown)
+
+    def touch(self, sid: str):
+        with self._lock:
+            self._pending[sid] = utils.get_current_datetime_str()
+            self._stats['touched'] += 1
+
+    def get_pending(self, sid: str) -> str | None:
+        with self._lock:
+            return self._pending.get(sid)
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+
+        # 요청 트랜잭션과 분리된 별도 연결 사용
+        conn = db.pool.acquire()
+        try:
+            conn.executemany("UPDATE user_sessions SET last_accessed = ? WHERE sid = ?", [(accessed_at, sid) for sid, accessed_at in pending.items()])
+            conn.commit()
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['flushed_rows'] += len(pending)
+        except sqlite3.Error as e:
+            print(f"Failed to flush session access times: {e}")
+            # 실패한 항목은 더 최신 기록이 없을 때만 다시 대기열에 추가
+            with self._lock:
+                self._stats['failures'] += 1
+                for sid, accessed_at in pending.items():
+                    self._pending.setdefault(sid, accessed_at)
+        finally:
+            db.pool.release(conn)
+
+    def shutdown(self):
+        self._stop_event.set()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+access_tracker = SessionAccessTracker(flush_interval=float(os.environ.get('SESSION_ACCESS_FLUSH_INTERVAL', 10)))
+
+# 요청마다 한 번만 검증된 세션 정보. 라우터에서 flask.g.session으로 전달
+@dataclass(frozen=True)
+class SessionPrincipal:
+    sid: str
+    uid: str
+    expires_at: str
+
+def _get_token_principal(token: str) -> utils.ResultDTO:
+    # DB 조회 없이 서명, 만료, 폐기 여부만 확인
+    payload = session_token.verify(token)
+    if payload is None:
+        return utils.ResultDTO(code=401, message="유효하지 않은 세션 ID입니다.", result=False)
+    if utils.get_current_datetime_str() > payload['exp']:
+        return utils.ResultDTO(code=401, message="세션이 만료되었습니다.", result=False)
+
+    sync_revoked_sessions()
+    if payload['sid'] in revoked_sessions:
+        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
+
+    principal = SessionPrincipal(sid=payload['sid'], uid=payload['uid'], expires_at=payload['exp'])
+    return utils.ResultDTO(code=200, message="세션을 성공적으로 조회했습니다.", data={'principal': principal}, result=True)
+
+def resolve_sid(sid: str) -> str:
+    # 서명 토큰이면 내부 세션 ID로 변환. 서명이 올바르지 않으면 그대로 반환(조회 시 실패 처리됨)
+    if session_token.is_token(sid):
+        payload = session_token.verify(sid)
+        if payload is not None:
+            return payload['sid']
+    return sid
+
+def get_principal(sid: str) -> utils.ResultDTO:
+    if not sid:
+        return utils.ResultDTO(code=401, message="세션 ID가 필요합니다.", result=False)
+    if session_token.is_enabled() and session_token.is_token(sid):
+        return _get_token_principal(sid)
 
-def get_session_list(sid: str) -> utils.ResultDTO:
-    # 세션 ID가 유효한지 확인
     session_info = get_info(sid)
     if not session_info.result:
-        return utils.ResultDTO(code=404, message="유효하지 않은 세션 ID입니다.", result=False)
-    # 세션이 비활성화된 경우 실패 처리
+        return session_info
     session_info = session_info.data['session_info']
     if not session_info['is_active']:
         return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
 
+    principal = SessionPrincipal(sid=session_info['sid'], uid=session_info['uid'], expires_at=session_info['expires_at'])
+    return utils.ResultDTO(code=200, message="세션을 성공적으로 조회했습니다.", data={'principal': principal}, result=True)
+
+def get_session_list(uid: str) -> utils.ResultDTO:
     conn = db.get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT * FROM user_sessions WHERE uid = ? ORDER BY created_at DESC", (session_info['uid'],))
+    cursor.execute("SELECT * FROM user_sessions WHERE uid = ? ORDER BY created_at DESC", (uid,))
     rows = cursor.fetchall()
 
     db.close_db_connection(conn)
-    return utils.ResultDTO(code=200, message="세션 목록을 성공적으로 조회했습니다.", data={"sessions_info" : [dict(row) for row in rows]}, result=True)
+
+    # 아직 반영되지 않은 접근 시간이 있으면 함께 반영
+    sessions_info = [dict(row) for row in rows]
+    for session_info in sessions_info:
+        session_info['last_accessed'] = access_tracker.get_pending(session_info['sid']) or session_info['last_accessed']
+
+    return utils.ResultDTO(code=200, message="세션 목록을 성공적으로 조회했습니다.", data={"sessions_info" : sessions_info}, result=True)
 
 def deactivate_session(sid: str) -> utils.ResultDTO:
     # 세션 ID가 유효한지 확인
@@ -37,11 +233,13 @@ def deactivate_session(sid: str) -> utils.ResultDTO:
     conn = db.get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE user_sessions SET is_active = 0 WHERE sid = ?", (sid,))
+        cursor.execute("UPDATE user_sessions SET is_active = 0, update_at = datetime('now', '+9 hours') WHERE sid = ?", (sid,))
         conn.commit()
+        invalidate_sessions(sid=sid)
         
         return utils.ResultDTO(code=200, message="로그아웃 되었습니다.", result=True)
     except sqlite3.Error as e:
+        db.rollback_request()
         return utils.ResultDTO(code=500, message=f"로그아웃에 실패했습니다: {e}", result=False)
     finally:
         db.close_db_connection(conn)
@@ -70,8 +268,9 @@ def create_session(email: str, password: str, user_agent: str, ip_address: str)
         conn.commit()
         
         # 최신 날짜 순으로 1개 세션만 유지. 나머지는 is_activate를 0으로 설정
-        cursor.execute("UPDATE user_sessions SET is_active = 0 WHERE uid = ? AND sid NOT IN (SELECT sid FROM user_sessions WHERE uid = ? ORDER BY created_at DESC LIMIT 1)", (uid.data['uid'], uid.data['uid']))
+        cursor.execute("UPDATE user_sessions SET is_active = 0, update_at = datetime('now', '+9 hours') WHERE uid = ? AND is_active = 1 AND sid NOT IN (SELECT sid FROM user_sessions WHERE uid = ? ORDER BY created_at DESC LIMIT 1)", (uid.data['uid'], uid.data['uid']))
         conn.commit()
+        invalidate_sessions(uid=uid.data['uid'])
         
         # 세션 비활성화 링크 이메일 첨부
         link_hash = utils.gen_hash(64)
@@ -81,6 +280,9 @@ def create_session(email: str, password: str, user_agent: str, ip_address: str)
         # 이메일 알림
         src.email.service.send_session_created_email(email, sid, link_hash)
         
+        # 서명 토큰 모드에서는 세션 ID 대신 서명된 토큰 발급
+        if session_token.is_enabled():
+            return utils.ResultDTO(code=200, message="성공적으로 로그인하였습니다.", data={'sid': session_token.issue(uid.data['uid'], sid, expires_at)}, result=True)
         return utils.ResultDTO(code=200, message="성공적으로 로그인하였습니다.", data={'sid': sid}, result=True)
     except sqlite3.IntegrityError:
         return utils.ResultDTO(code=409, message="세션이 이미 존재합니다.", result=False)
@@ -88,36 +290,46 @@ def create_session(email: str, password: str, user_agent: str, ip_address: str)
         db.close_db_connection(conn)
         
 def get_info(sid: str) -> utils.ResultDTO:
-    conn = db.get_db_connection()
-    cursor = conn.cursor()
+    session_info = session_cache.get(sid)
+    if session_info is None:
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
 
-    cursor.execute("SELECT * FROM user_sessions WHERE sid = ?", (sid,))
-    row = cursor.fetchone()
+        cursor.execute("SELECT * FROM user_sessions WHERE sid = ?", (sid,))
+        row = cursor.fetchone()
 
-    # 없는 세션 ID인 경우 실패 처리
-    if not row:
+        # 없는 세션 ID인 경우 실패 처리
+        if not row:
+            db.close_db_connection(conn)
+            return utils.ResultDTO(code=401, message="유효하지 않은 세션 ID입니다.", result=False)
+
+        session_info = {
+            'sid': row['sid'],
+            'uid': row['uid'],
+            'user_agent': row['user_agent'],
+            'ip_address': row['ip_address'],
+            'is_active': row['is_active'],
+            'last_accessed': row['last_accessed'],
+            'expires_at': row['expires_at'],
+            'created_at': row['created_at']
+        }
+
+        # 커밋되지 않은 변경사항이 캐시에 남지 않도록 트랜잭션 밖에서만 캐싱
+        if not conn.in_transaction:
+            session_cache.set(sid, session_info)
         db.close_db_connection(conn)
-        return utils.ResultDTO(code=401, message="유효하지 않은 세션 ID입니다.", result=False)
 
     # 현재 시간이 expires_at을 초과한 경우 실패 처리(is_active도 0으로 설정)
-    if utils.get_current_datetime() > utils.str_to_datetime(row['expires_at']):
-        cursor.execute("UPDATE user_sessions SET is_active = 0 WHERE sid = ?", (sid,))
+    if utils.get_current_datetime() > utils.str_to_datetime(session_info['expires_at']):
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE user_sessions SET is_active = 0, update_at = datetime('now', '+9 hours') WHERE sid = ?", (sid,))
+        conn.commit()
         db.close_db_connection(conn)
+        invalidate_sessions(sid=sid)
         return utils.ResultDTO(code=401, message="세션이 만료되었습니다.", result=False)
 
-    session_info = {
-        'sid': row['sid'],
-        'uid': row['uid'],
-        'user_agent': row['user_agent'],
-        'ip_address': row['ip_address'],
-        'is_active': row['is_active'],
-        'last_accessed': row['last_accessed'],
-        'expires_at': row['expires_at'],
-        'created_at': row['created_at']
-    }
-
-    db.close_db_connection(conn)
-    return utils.ResultDTO(code=200, message="세션을 성공적으로 조회했습니다.", data={'session_info': session_info}, result=True)
+    return utils.ResultDTO(code=200, message="세션을 성공적으로 조회했습니다.", data={'session_info': dict(session_info)}, result=True)
 
 def deactivate_all_sessions(uid: int) -> utils.ResultDTO:
     # 사용자 존재 여부 확인
@@ -129,11 +341,13 @@ def deactivate_all_sessions(uid: int) -> utils.ResultDTO:
     cursor = conn.cursor()
 
     try:
-        cursor.execute("UPDATE user_sessions SET is_active = 0 WHERE uid = ?", (uid,))
+        cursor.execute("UPDATE user_sessions SET is_active = 0, update_at = datetime('now', '+9 hours') WHERE uid = ? AND is_active = 1", (uid,))
         conn.commit()
+        invalidate_sessions(uid=uid)
 
         return utils.ResultDTO(code=200, message="모든 세션이 성공적으로 비활성화되었습니다.", result=True)
     except sqlite3.Error as e:
+        db.rollback_request()
         return utils.ResultDTO(code=500, message=f"세션 비활성화에 실패했습니다: {e}", result=False)
     finally:
         db.close_db_connection(conn)
@@ -174,6 +388,10 @@ def mark_deactive_link_as_used(link_hash: str) -> utils.ResultDTO:
 
         return utils.ResultDTO(code=200, message="링크가 성공적으로 사용 처리되었습니다.", result=True)
     except sqlite3.Error as e:
+        db.rollback_request()
         return utils.ResultDTO(code=500, message=f"링크 사용 처리에 실패했습니다: {e}", result=False)
     finally:
-        db.close_db_connection(conn)
\ No newline at end of file
+        db.close_db_connection(conn)
+
+if session_token.is_enabled():
+    load_revoked_sessions()
\ No newline at end of file
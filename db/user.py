@@ -166,7 +166,7 @@ def delete_user(email: str, password: str) -> utils.ResultDTO:
 
     try:
         # Delete user sessions
-        cursor.execute("UPDATE user_sessions SET is_active = 0 WHERE uid = ?", (uid,))
+        cursor.execute("UPDATE user_sessions SET is_active = 0, update_at = datetime('now', '+9 hours') WHERE uid = ? AND is_active = 1", (uid,))
         
         # Delete user foods
         cursor.execute("DELETE FROM foods WHERE uid = ?", (uid,))
@@ -175,11 +175,14 @@ def delete_user(email: str, password: str) -> utils.ResultDTO:
         cursor.execute("DELETE FROM users WHERE uid = ?", (uid,))
         
         conn.commit()
+        db.session.invalidate_sessions(uid=uid)
         
         src.email.service.send_deleted_account_email(email, user_info)
         
         return utils.ResultDTO(code=200, message="탈퇴가 완료되었습니다.\n이용해주셔서 감사합니다.", result=True)
     except sqlite3.Error as e:
+        # 요청 트랜잭션의 앞선 변경도 함께 취소
+        db.rollback_request()
         return utils.ResultDTO(code=500, message=f"탈퇴에 실패했습니다: {str(e)}", result=False)
     finally:
         db.close_db_connection(conn)
@@ -369,15 +372,16 @@ def change_password(link_hash: str, new_password: str) -> utils.ResultDTO:
         conn.commit()
     except Exception as e:
         conn.rollback()
+        db.rollback_request()
         return utils.ResultDTO(code=500, message=f"비밀번호 변경 중 오류가 발생했습니다: {e}", result=False)
     finally:
         db.close_db_connection(conn)
 
     return utils.ResultDTO(code=200, message="비밀번호를 성공적으로 변경했습니다.", result=True)
 
-def update_password(sid, password, change_password) -> utils.ResultDTO:
-    if not sid:
-        return utils.ResultDTO(code=400, message="SID가 필요합니다.", result=False)
+def update_password(uid, password, change_password) -> utils.ResultDTO:
+    if not uid:
+        return utils.ResultDTO(code=400, message="UID가 필요합니다.", result=False)
     if not password:
         return utils.ResultDTO(code=400, message="현재 비밀번호가 필요합니다.", result=False)
     if not change_password:
@@ -385,13 +389,6 @@ def update_password(sid, password, change_password) -> utils.ResultDTO:
     if not utils.is_valid_password(change_password):
         return utils.ResultDTO(code=400, message="비밀번호 형식이 올바르지 않습니다. (영문, 숫자, 기호 8~256자)", result=False)
     
-    session_info = db.session.get_info(sid)
-    if not session_info.result:
-        return session_info.to_response()
-    if not session_info.data['session_info']['is_active']:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
-    
-    uid = session_info.data['session_info']['uid']
     validate_info = validate_user_by_uid(uid, password)
     if not validate_info.result:
         return utils.ResultDTO(code=401, message="현재 비밀번호가 일치하지 않습니다.", result=False)
@@ -416,19 +413,12 @@ def update_password(sid, password, change_password) -> utils.ResultDTO:
     
     return utils.ResultDTO(code=200, message="비밀번호가 성공적으로 변경되었습니다.", result=True)
     
-def update_name(sid, change_name) -> utils.ResultDTO:
-    if not sid:
-        return utils.ResultDTO(code=400, message="SID가 필요합니다.", result=False)
+def update_name(uid, change_name) -> utils.ResultDTO:
+    if not uid:
+        return utils.ResultDTO(code=400, message="UID가 필요합니다.", result=False)
     if not utils.is_valid_username(change_name):
         return utils.ResultDTO(code=400, message="올바르지 않은 이름입니다. (한글, 영어 1~20자)", result=False)
-    
-    session_info = db.session.get_info(sid)
-    if not session_info.result:
-        return session_info.to_response()
-    if not session_info.data['session_info']['is_active']:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
 
-    uid = session_info.data['session_info']['uid']
     conn = db.get_db_connection()
     cursor = conn.cursor()
 
@@ -442,19 +432,12 @@ def update_name(sid, change_name) -> utils.ResultDTO:
     db.close_db_connection(conn)
     return utils.ResultDTO(code=200, message="이름이 성공적으로 변경되었습니다.", result=True)
 
-def update_profile_image(sid, profile_url) -> utils.ResultDTO:
-    if not sid:
-        return utils.ResultDTO(code=400, message="SID가 필요합니다.", result=False)
+def update_profile_image(uid, profile_url) -> utils.ResultDTO:
+    if not uid:
+        return utils.ResultDTO(code=400, message="UID가 필요합니다.", result=False)
     if not profile_url:
         return utils.ResultDTO(code=400, message="프로필 이미지 URL이 필요합니다.", result=False)
-    
-    session_info = db.session.get_info(sid)
-    if not session_info:
-        return session_info.to_response()
-    if not session_info.data['session_info']['is_active']:
-        return utils.ResultDTO(code=401, message="비활성화된 세션입니다.", result=False)
-    
-    uid = session_info.data['session_info']['uid']
+
     conn = db.get_db_connection()
     cursor = conn.cursor()
 
@@ -1,7 +1,17 @@
-from flask import Blueprint, render_template, send_file
+import hmac
+import os
+from flask import Blueprint, render_template, send_file, request
 from router.user import user_bp
 from router.session import session_bp
 from router.food import food_bp
+import db
+import db.session
+import db.product
+import db.food_chat
+import src.utils as utils
+import src.ingredients
+import src.llm
+import src.email
 
 router_bp = Blueprint('router', __name__)
 router_bp.register_blueprint(user_bp, url_prefix='/user')
@@ -14,4 +24,31 @@ def index():
 
 @router_bp.route('/favicon.ico')
 def favicon():
-    return send_file('static/favicon.ico')
\ No newline at end of file
+    return send_file('static/favicon.ico')
+
+@router_bp.route('/status', methods=['GET'])
+def status():
+    # 내부 모니터링 용도. STATUS_TOKEN을 설정한 경우에만 Authorization: Bearer <STATUS_TOKEN>으로 조회 가능
+    # 리버스 프록시 뒤에서는 모든 요청이 로컬 주소에서 오므로 접속 주소로는 구분하지 않음
+    status_token = os.environ.get('STATUS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    if not status_token or not hmac.compare_digest(authorization.encode(), f"Bearer {status_token}".encode()):
+        return utils.ResultDTO(code=404, message="잘못된 URL 요청입니다.", result=False).to_response()
+
+    return utils.ResultDTO(code=200, message="서버 상태를 성공적으로 조회했습니다.", data={
+        'db_pool': db.get_pool_stats(),
+        'session_cache': db.session.session_cache.stats(),
+        'session_access': db.session.access_tracker.stats(),
+        'upstreams': {
+            'foodsafetykorea': db.product.foodsafety_upstream.stats(),
+            'retaildb': db.product.retaildb_upstream.stats()
+        },
+        'ingredients': src.ingredients.store.stats(),
+        'food_chat': db.food_chat.foodchat_service.stats(),
+        'food_chat_streams': db.food_chat.chat_streams.stats(),
+        'food_chat_waits': db.food_chat.chat_status_notifier.stats(),
+        'recipe_cache': db.food_chat.recipe_cache.stats(),
+        'recipe_flights': db.food_chat.recipe_flights.stats(),
+        'llm': src.llm.backend.stats(),
+        'email': src.email.service.stats()
+    }, result=True).to_response()
\ No newline at end of file
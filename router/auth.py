@@ -0,0 +1,18 @@
+from flask import g, request
+from functools import wraps
+import db.session
+
+def session_required(f):
+    # sid를 요청당 한 번만 검증하고 g.session에 SessionPrincipal로 저장
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        sid = request.values.get('sid')
+
+        principal_info = db.session.get_principal(sid)
+        if not principal_info.result:
+            return principal_info.to_response()
+        g.session = principal_info.data['principal']
+        db.session.access_tracker.touch(g.session.sid)
+
+        return f(*args, **kwargs)
+    return decorated_function
\ No newline at end of file
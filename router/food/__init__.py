@@ -1,5 +1,6 @@
-from flask import Blueprint, Response, request, stream_with_context
+from flask import Blueprint, Response, g, request, stream_with_context
 from router.food.chat import chat_bp
+from router.auth import session_required
 import db.user
 import db.session
 import db.food
@@ -10,29 +11,61 @@ food_bp = Blueprint('food', __name__, url_prefix='/food')
 food_bp.register_blueprint(chat_bp)
 
 @food_bp.route('', methods=['GET'])
+@session_required
 def get_food_info():
-    sid = request.args.get('sid')
     fid = request.args.get('fid')
     
-    return db.food.get_info(sid, fid).to_response()
+    return db.food.get_info(g.session.uid, fid).to_response()
 
 @food_bp.route('', methods=['POST'])
+@session_required
 def regi_food():
-    session_id = request.form.get('sid')
     barcode = request.form.get('barcode')
     count = request.form.get('count', 1, type=int)
 
-    return db.food.regi_food_with_barcode(session_id, barcode, count).to_response()
+    return db.food.regi_food_with_barcode(g.session.uid, barcode, count).to_response()
+
+@food_bp.route('/bulk', methods=['POST'])
+@session_required
+def regi_food_bulk():
+    barcodes = request.form.getlist('barcode')
+    counts = request.form.getlist('count')
+    # count를 생략하면 모두 1개, 지정하면 barcode와 같은 개수여야 함
+    if counts and len(counts) != len(barcodes):
+        return utils.ResultDTO(code=400, message="barcode와 count의 개수가 일치하지 않습니다.", result=False).to_response()
+    
+    items = []
+    for index, barcode in enumerate(barcodes):
+        try:
+            count = int(counts[index]) if counts else 1
+        except ValueError:
+            count = None
+        items.append((barcode, count))
+
+    return db.food.regi_foods_with_barcodes(g.session.uid, items).to_response()
 
 @food_bp.route('', methods=['DELETE'])
+@session_required
 def delete_food():
-    sid = request.form.get('sid')
     fid = request.form.get('fid')
 
-    return db.food.delete_food(sid, fid).to_response()
+    return db.food.delete_food(g.session.uid, fid).to_response()
 
 @food_bp.route('/list', methods=['GET'])
+@session_required
 def get_food_list():
-    sid = request.args.get('sid')
+    active_only = request.args.get('active_only', '1') != '0'
+    food_type = request.args.get('type')
+    expiring_within = request.args.get('expiring_within', None, type=int)
+    sort = request.args.get('sort', 'expiration_asc')
+    limit = request.args.get('limit', db.food.FOOD_LIST_DEFAULT_LIMIT, type=int)
+    cursor = request.args.get('cursor')
+    since = request.args.get('since')
+    
+    # since가 있으면 해당 커서 이후 변경분(삭제 포함)만 반환
+    if since is not None:
+        limit = request.args.get('limit', db.food.FOOD_LIST_MAX_LIMIT, type=int)
+        return utils.to_conditional_response(db.food.get_changes(g.session.uid, since, limit=limit))
     
-    return db.food.get_list_info(sid).to_response()
+    return utils.to_conditional_response(db.food.get_list_info(g.session.uid, active_only=active_only, food_type=food_type, expiring_within=expiring_within,
+                                                               sort=sort, limit=limit, cursor=cursor))
@@ -1,24 +1,55 @@
-from flask import Blueprint, request
+import json
+from flask import Blueprint, Response, g, request
+from router.auth import session_required
 import db.food_chat
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/chat')
 
 @chat_bp.route('', methods=['GET'])
+@session_required
 def chat():
-    sid = request.args.get('sid')
     fcid = request.args.get('fcid')
+    wait = request.args.get('wait', 0, type=float)
 
-    return db.food_chat.get_info(sid, fcid).to_response()
+    # wait(초)를 지정하면 대화가 완료/실패할 때까지 최대 wait초 대기 후 응답(long polling)
+    if wait > 0:
+        return db.food_chat.wait_for_chat(g.session.uid, fcid, wait).to_response()
+    return db.food_chat.get_status(g.session.uid, fcid).to_response()
 
 @chat_bp.route('', methods=['POST'])
+@session_required
 def create_food_chat():
-    sid = request.form.get('sid')
     fid_list = request.form.getlist('fid')
 
-    return db.food_chat.create_chat_db(sid, fid_list).to_response()
+    return db.food_chat.create_chat_db(g.session.uid, fid_list).to_response()
 
 @chat_bp.route('/list', methods=['GET'])
+@session_required
 def list_food_chats():
-    sid = request.args.get('sid')
+    sort = request.args.get('sort', 'created_asc')
+    limit = request.args.get('limit', db.food_chat.FOOD_CHAT_LIST_DEFAULT_LIMIT, type=int)
+    cursor = request.args.get('cursor')
+    # 목록에서는 response=preview 또는 none으로 응답 본문 크기를 줄일 수 있음
+    response = request.args.get('response', 'full')
 
-    return db.food_chat.get_list_info(sid).to_response()
\ No newline at end of file
+    return db.food_chat.get_list_info(g.session.uid, sort=sort, limit=limit, cursor=cursor, response=response).to_response()
+
+@chat_bp.route('/stream', methods=['GET'])
+@session_required
+def stream_food_chat():
+    fcid = request.args.get('fcid')
+
+    food_chat_info = db.food_chat.get_info(g.session.uid, fcid)
+    if not food_chat_info.result:
+        return food_chat_info.to_response()
+
+    # Server-Sent Events로 생성 중인 레시피를 토큰 단위로 전달
+    # 요청 컨텍스트 없이 스트리밍하므로 응답 중에는 요청 DB 연결을 점유하지 않음
+    def generate(uid: str):
+        for event, data in db.food_chat.stream_chat(uid, fcid):
+            if event == 'ping':
+                yield ": ping\n\n"
+                continue
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return Response(generate(g.session.uid), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -1,4 +1,5 @@
-from flask import Blueprint, request
+from flask import Blueprint, g, request
+from router.auth import session_required
 import src.utils as utils
 import db.session
 
@@ -6,7 +7,7 @@ session_bp = Blueprint('session', __name__, url_prefix='/session')
 
 @session_bp.route('', methods=['GET'])
 def get_session_info():
-    sid = request.args.get('sid')
+    sid = db.session.resolve_sid(request.args.get('sid'))
 
     return db.session.get_info(sid).to_response()
 
@@ -21,15 +22,14 @@ def create_session():
 
 @session_bp.route('', methods=['DELETE'])
 def delete_session():
-    sid = request.form.get('sid')
+    sid = db.session.resolve_sid(request.form.get('sid'))
 
     return db.session.deactivate_session(sid).to_response()
 
 @session_bp.route('/list', methods=['GET'])
+@session_required
 def list_sessions():
-    sid = request.args.get('sid')
-
-    sessions = db.session.get_session_list(sid)
+    sessions = db.session.get_session_list(g.session.uid)
     
     # If no sessions found or session ID is invalid
     if not sessions.result:
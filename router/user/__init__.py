@@ -1,4 +1,5 @@
-from flask import Blueprint, request, session
+from flask import Blueprint, g, request, session
+from router.auth import session_required
 import db.user
 import src.utils as utils
 
@@ -74,26 +75,24 @@ def find_password():
         return db.user.find_password(user_email).to_response()
     
 @user_bp.route('/profile', methods=['POST'])
+@session_required
 def update_profile():
-    sid = request.form.get('sid')
-    if not sid:
-        return utils.ResultDTO(code=401, message="Require sid.").to_response()
-
+    uid = g.session.uid
     new_name = request.form.get('name')
     password = request.form.get('password')
     new_password = request.form.get('new_password')
     new_profile_image_url = request.form.get('profile_image_url')
     
     if new_name:
-        name_update_result = db.user.update_name(sid, new_name)
+        name_update_result = db.user.update_name(uid, new_name)
         if not name_update_result.result:
             return name_update_result.to_response()
     if password and new_password:
-        password_update_result = db.user.update_password(sid, password, new_password)
+        password_update_result = db.user.update_password(uid, password, new_password)
         if not password_update_result.result:
             return password_update_result.to_response()
     if new_profile_image_url:
-        profile_image_update_result = db.user.update_profile_image(sid, new_profile_image_url)
+        profile_image_update_result = db.user.update_profile_image(uid, new_profile_image_url)
         if not profile_image_update_result.result:
             return profile_image_update_result.to_response()
 
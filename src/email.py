@@ -1,8 +1,12 @@
 
 import smtplib
 import os
-import threading
-import queue
+import sqlite3
+import random
+import time
+import db
+import db.email_outbox
+import db.lease_queue
 import src.utils as utils
 from flask import render_template
 from email.mime.text import MIMEText
@@ -10,55 +14,260 @@ from email.mime.multipart import MIMEMultipart
 import db.user
 import db.session
 
+# 우선순위. 숫자가 작을수록 먼저 전송
+PRIORITY_HIGH = 0    # 인증코드, 비밀번호 찾기
+PRIORITY_NORMAL = 1  # 가입 환영, 로그인 알림 등
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal'}
+
+# 인증된 SMTP 연결 하나. 워커 스레드마다 하나씩 유지하며 재사용
+# 대기 중에는 NOOP으로 연결을 확인하고, idle_timeout 동안 보낼 메일이 없으면 연결 종료
+class SMTPSession:
+    def __init__(self, smtp_server: str, smtp_port: int, sender_email: str, password: str, timeout: float):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender_email = sender_email
+        self.password = password
+        self.timeout = timeout
+        self.connections = 0
+        self._smtp = None
+        self._last_used_at = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self._smtp is not None
+
+    def _connect(self):
+        print(f"Connecting to SMTP server: {self.smtp_server}:{self.smtp_port} as {self.sender_email}")
+        smtp = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        try:
+            smtp.starttls()
+            smtp.login(self.sender_email, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        print("Connected to SMTP server successfully.")
+        self.connections += 1
+        self._smtp = smtp
+
+    def _reset(self):
+        if self._smtp is not None:
+            self._smtp.close()
+            self._smtp = None
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    def keepalive(self, idle_timeout: float) -> bool:
+        # NOOP을 보냈으면 True
+        if self._smtp is None:
+            return False
+        if time.monotonic() - self._last_used_at >= idle_timeout:
+            self.close()
+            return False
+        try:
+            code, _ = self._smtp.noop()
+            if code != 250:
+                self.close()
+        except (smtplib.SMTPException, OSError):
+            # 끊어진 연결은 다음 전송 시 다시 연결
+            self._reset()
+        return True
+
+    def send(self, receiver_email: str, message: str) -> bool:
+        # 연결이 끊어졌으면 한 번 다시 연결해서 재시도. 다시 연결했으면 True
+        reconnected = False
+        for attempt in range(2):
+            try:
+                if self._smtp is None:
+                    self._connect()
+                    reconnected = bool(attempt)
+                self._smtp.sendmail(self.sender_email, receiver_email, message)
+                self._last_used_at = time.monotonic()
+                return reconnected
+            except Exception as e:
+                # 수신자 거부 등 메일 단위 오류는 연결을 유지. SMTPException도 OSError의 하위 클래스이므로 먼저 구분
+                disconnected = isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)) or \
+                    (isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException))
+                if not disconnected or attempt:
+                    raise
+                self._reset()
+
 # Setting Email
-class EmailSender:
+# 보낼 메일은 email_outbox 테이블에 저장하고(db.lease_queue.LeaseQueue), 여러 워커가 묶음으로 가져가 각자의 SMTP 연결로 전송
+# 전송에 실패하면 지수 백오프로 재시도하고, max_attempts를 넘거나 수신자 거부 등 영구 오류면 dead로 남김
+# 전송 중 프로세스가 종료되면 lease가 만료된 뒤 다른 워커가 다시 보냄(중복 전송 가능, 유실 없음)
+class EmailSender(db.lease_queue.LeaseQueue):
     def __init__(self):
         self.smtp_server  = os.environ['MAIL_SERVER']
         self.smtp_port    = os.environ['MAIL_PORT']
         self.sender_email = os.environ['MAIL_USERNAME']
         self.password     = os.environ['MAIL_PASSWORD']
-        self.email_queue = queue.Queue()
-        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
-        self.worker_thread.start()
+        self.timeout = float(os.environ.get('MAIL_TIMEOUT', 10))
+        self.keepalive_interval = float(os.environ.get('MAIL_KEEPALIVE_INTERVAL', 30))
+        self.idle_timeout = float(os.environ.get('MAIL_IDLE_TIMEOUT', 300))
+        self.batch_size = int(os.environ.get('MAIL_BATCH_SIZE', 20))
+        self.retry_base_delay = float(os.environ.get('MAIL_RETRY_BASE_DELAY', 5))
+        self.retry_max_delay = float(os.environ.get('MAIL_RETRY_MAX_DELAY', 600))
+        super().__init__('email', 'email_outbox', 'eid', 'sending', 'dead',
+                         workers=int(os.environ.get('MAIL_WORKERS', 2)),
+                         lease_seconds=float(os.environ.get('MAIL_LEASE_SECONDS', 60)),
+                         poll_interval=float(os.environ.get('MAIL_POLL_INTERVAL', 2)),
+                         shutdown_timeout=float(os.environ.get('MAIL_SHUTDOWN_TIMEOUT', 10)),
+                         max_attempts=int(os.environ.get('MAIL_MAX_ATTEMPTS', 5)))
+
+        self._sessions = []
+        self._stats.update({
+            'enqueued': 0,
+            'sent': 0,
+            'retried': 0,
+            'dead': 0,
+            'preempted': 0,
+            'reconnects': 0,
+            'noops': 0,
+            'batches': 0
+        })
+        self._timings.update({key: [0.0, 0.0, 0] for key in ('wait', 'send')})
+        self.start()
 
     def _worker(self):
-        while True:
-            item = self.email_queue.get()
-            if item is None:
-                break
-            receiver_email, subject, plain, html = item
-            self._send_email_now(receiver_email, subject, plain, html)
-            self.email_queue.task_done()
-
-    def _send_email_now(self, receiver_email: str, subject: str, plain, html):
+        session = SMTPSession(self.smtp_server, int(self.smtp_port), self.sender_email, self.password, self.timeout)
+        with self._lock:
+            self._sessions.append(session)
+
+        last_active_at = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                batch = db.email_outbox.claim(self.lease_owner, self.lease_seconds, self.batch_size)
+            except sqlite3.Error as e:
+                print(f"Failed to claim emails: {e}")
+                batch = []
+
+            if not batch:
+                self.wait(self.poll_interval)
+                if time.monotonic() - last_active_at >= self.keepalive_interval:
+                    last_active_at = time.monotonic()
+                    if session.keepalive(self.idle_timeout):
+                        self.count('noops')
+                continue
+
+            # 가져온 메일은 우선순위 순서대로 같은 연결로 이어서 전송
+            # 종료 중이면 남은 메일은 보내지 않고 shutdown에서 lease를 반환
+            eids = [mail['eid'] for mail in batch]
+            self.hold(eids)
+            self.count('batches')
+            try:
+                for position, mail in enumerate(batch):
+                    if self._stop_event.is_set():
+                        break
+                    # 묶음을 보내는 도중 더 높은 우선순위의 메일이 들어오면 남은 메일을 반환하고 다시 가져감
+                    if position and mail['priority'] > PRIORITY_HIGH and self._has_queued_before(mail['priority']):
+                        self._release(eids[position:])
+                        break
+                    self._send(session, mail)
+                    self.unhold([mail['eid']])
+            finally:
+                self.unhold(eids)
+            last_active_at = time.monotonic()
+        session.close()
+
+    def _has_queued_before(self, priority: int) -> bool:
+        try:
+            return db.email_outbox.has_queued_before(priority)
+        except sqlite3.Error as e:
+            print(f"Failed to check queued emails: {e}")
+            return False
+
+    def _release(self, eids: list):
+        try:
+            released = self.release(eids)
+        except sqlite3.Error as e:
+            # 반환하지 못한 메일은 lease가 만료된 뒤 다시 대기열로 돌아감
+            print(f"Failed to release emails: {e}")
+            return
+        self.count('preempted', released)
+
+    def _retry_delay(self, attempts: int) -> float:
+        # 지수 백오프. 여러 메일이 같은 시각에 몰리지 않도록 50~100% 사이로 흩뜨림
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** max(0, attempts - 1))
+        return round(delay * random.uniform(0.5, 1.0), 3)
+
+    @staticmethod
+    def _is_permanent_error(e: Exception) -> bool:
+        # 수신자 거부, 메일 내용에 대한 5xx 응답은 재시도해도 같은 결과. 인증 실패 등 서버 설정 문제는 재시도
+        return isinstance(e, smtplib.SMTPRecipientsRefused) or (isinstance(e, smtplib.SMTPDataError) and 500 <= e.smtp_code < 600)
+
+    def _send(self, session: SMTPSession, mail: dict):
+        receiver_email, subject = mail['receiver_email'], mail['subject']
+        started_at = time.monotonic()
+        self.record('wait', max(0.0, mail['wait_ms']))
+
         msg = MIMEMultipart("alternative")
         msg['Subject'] = subject
         msg['From'] = self.sender_email
         msg['To'] = receiver_email
 
-        msg.attach(MIMEText(plain, 'plain'))
-        msg.attach(MIMEText(html, 'html'))
+        msg.attach(MIMEText(mail['plain'], 'plain'))
+        msg.attach(MIMEText(mail['html'], 'html'))
 
+        reconnected = False
         try:
-            print(f"Connecting to SMTP server: {self.smtp_server}:{self.smtp_port} as {self.sender_email}")
-            with smtplib.SMTP(self.smtp_server, int(self.smtp_port)) as smtp:
-                smtp.starttls()
-                smtp.login(self.sender_email, self.password)
-                print("Connected to SMTP server successfully.")
-                print(f"Sending email to {receiver_email} with subject: {subject}")
-                smtp.sendmail(self.sender_email, receiver_email, msg.as_string())
-                print("Email sent successfully.")
+            print(f"Sending email to {receiver_email} with subject: {subject}")
+            reconnected = session.send(receiver_email, msg.as_string())
+            print("Email sent successfully.")
+            result = 'sent'
+            db.email_outbox.mark_sent(mail['eid'], self.lease_owner)
+        except sqlite3.Error as e:
+            # 전송은 했지만 outbox에서 지우지 못한 경우. lease가 만료되면 다시 보낼 수 있음
+            print(f"Failed to mark email as sent: {e}")
         except Exception as e:
             print(f"Failed to send email: {e}")
+            try:
+                result = db.email_outbox.mark_failed(mail['eid'], self.lease_owner, str(e), self._retry_delay(mail['attempts']),
+                                                     self.max_attempts, permanent=self._is_permanent_error(e))
+            except sqlite3.Error as db_error:
+                print(f"Failed to mark email as failed: {db_error}")
+                result = None
+            result = {'queued': 'retried', 'dead': 'dead'}.get(result)
+            if result == 'dead':
+                print(f"Email to {receiver_email} moved to dead letter after {mail['attempts']} attempts.")
+
+        self.record('send', (time.monotonic() - started_at) * 1000)
+        if result:
+            self.count(result)
+        if reconnected:
+            self.count('reconnects')
+
+    def _on_enqueued(self):
+        self.count('enqueued')
+        self.notify()
 
-    def send_email(self, receiver_email: str, subject: str, plain, html):
-        self.email_queue.put((receiver_email, subject, plain, html))
+    def send_email(self, receiver_email: str, subject: str, plain, html, priority: int = PRIORITY_NORMAL):
+        # outbox에 INSERT만 하고 반환. 요청 중이면 요청 트랜잭션이 커밋된 뒤에 워커를 깨움
+        db.email_outbox.enqueue(receiver_email, subject, plain, html, priority)
+        db.on_commit(self._on_enqueued)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats['connections'] = sum(session.connections for session in self._sessions)
+            stats['connected'] = sum(1 for session in self._sessions if session.connected)
+        depth = db.email_outbox.get_queue_depth()
+        stats['queue_depth'] = {PRIORITY_NAMES.get(priority, priority): count for priority, count in depth.get('queued', {}).items()}
+        stats['sending'] = sum(depth.get('sending', {}).values())
+        stats['dead_letters'] = sum(depth.get('dead', {}).values())
+        return stats
 
     def send_verification_code_email(self, receiver_email: str, code: str):
         subject = f'[스마일푸드] 인증코드 {code}'
         plain = f'이메일 인증을 위한 코드는 {code}입니다.'
         html = render_template('email/send_verification_code_email.html', receiver_email=receiver_email, code=code)
-        self.send_email(receiver_email, subject, plain, html)
+        self.send_email(receiver_email, subject, plain, html, priority=PRIORITY_HIGH)
 
     def send_welcome_email(self, receiver_email: str, user_info: utils.ResultDTO):
         subject = '[스마일푸드] 회원가입을 환영합니다'
@@ -86,6 +295,6 @@ class EmailSender:
         plain = f'비밀번호 찾기 요청: {user_info.data["user_info"]["name"]}님, 비밀번호 변경 요청이 발생했습니다.'
         password_find_url = f"{os.environ['SERVER_URL']}/user/find_password?link_hash={link_hash}"
         html = render_template('email/password_find_email.html', password_find_url=password_find_url, user_info=user_info.data["user_info"])
-        self.send_email(receiver_email, subject, plain, html)
+        self.send_email(receiver_email, subject, plain, html, priority=PRIORITY_HIGH)
     
 service = EmailSender()
@@ -0,0 +1,153 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# 바코드별 원재료 정보 저장소
+# 원본 JSON을 바코드 PK로 정렬된 읽기 전용 SQLite 인덱스로 변환해 두고 조회(O(log n), mmap)
+# 인덱스는 임시 파일에 만든 뒤 os.replace로 교체하므로 조회 중에도 안전하게 갱신됨
+class IngredientsStore:
+    def __init__(self, source_path: str, index_path: str, check_interval: float = 5, mmap_size: int = 64 * 1024 * 1024):
+        self.source_path = source_path
+        self.index_path = index_path
+        self.check_interval = check_interval
+        self.mmap_size = mmap_size
+
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._version = None
+        self._checked_at = 0.0
+        self._building = False
+        self._stats = {
+            'lookups': 0,
+            'hits': 0,
+            'builds': 0,
+            'reloads': 0
+        }
+
+    def _index_version(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _source_mtime(self):
+        try:
+            return os.stat(self.source_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def build(self):
+        with open(self.source_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        tmp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("CREATE TABLE ingredients (barcode TEXT PRIMARY KEY, ingredients TEXT NOT NULL) WITHOUT ROWID")
+            conn.executemany("INSERT INTO ingredients (barcode, ingredients) VALUES (?, ?)", sorted((str(k), str(v)) for k, v in data.items()))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.index_path)
+
+        with self._lock:
+            self._stats['builds'] += 1
+
+    def _build_in_background(self):
+        def build_thread():
+            try:
+                self.build()
+            except Exception as e:
+                print(f"Failed to build ingredients index: {e}")
+            finally:
+                with self._lock:
+                    self._building = False
+                    self._checked_at = 0.0
+
+        threading.Thread(target=build_thread, daemon=True).start()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+
+            version = self._index_version()
+            source_mtime = self._source_mtime()
+            stale = version is not None and source_mtime is not None and source_mtime > version[1]
+            if stale and not self._building:
+                # 원본이 갱신되면 백그라운드에서 다시 만들고, 완료 전까지는 기존 인덱스로 조회
+                self._building = True
+                self._build_in_background()
+            if version is None and source_mtime is not None:
+                # 최초 실행 시에는 인덱스가 없으므로 동기적으로 생성
+                self.build()
+                version = self._index_version()
+
+            if version != self._version:
+                if self._version is not None:
+                    self._stats['reloads'] += 1
+                self._version = version
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'version', None) != self._version:
+            if getattr(local, 'conn', None) is not None:
+                local.conn.close()
+            local.conn = None
+            if self._version is not None:
+                local.conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+                local.conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            local.version = self._version
+        return local.conn
+
+    def get(self, barcode: str) -> str | None:
+        self._refresh()
+        conn = self._connection()
+        with self._lock:
+            self._stats['lookups'] += 1
+        if conn is None:
+            return None
+
+        row = conn.execute("SELECT ingredients FROM ingredients WHERE barcode = ?", (barcode,)).fetchone()
+        if not row:
+            return None
+        with self._lock:
+            self._stats['hits'] += 1
+        return row[0]
+
+    def reload(self):
+        # 원본 갱신 여부를 즉시 확인
+        with self._lock:
+            self._checked_at = 0.0
+        self._refresh()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['building'] = self._building
+        return stats
+
+store = IngredientsStore(
+    source_path=os.environ.get('INGREDIENTS_SOURCE_PATH', os.path.join(os.path.dirname(__file__), '../static/ingredients_info.json')),
+    index_path=os.environ.get('INGREDIENTS_INDEX_PATH', os.path.join(os.path.dirname(__file__), '../db/ingredients.db')),
+    check_interval=float(os.environ.get('INGREDIENTS_CHECK_INTERVAL', 5))
+)
+
+if __name__ == '__main__':
+    # 배포 전 인덱스를 미리 생성: python src/ingredients.py build
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        store.build()
+        print(f"원재료 인덱스를 생성했습니다: {store.index_path}")
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from openai import OpenAI
+from dotenv import load_dotenv
+load_dotenv()
+
+# 레시피 생성에 사용하는 LLM 백엔드
+# generate(prompt, publish)는 출력 토큰을 받는 대로 publish(delta)로 전달하고 (응답, 입력 토큰, 출력 토큰) 반환
+class LLMBackend(ABC):
+    name = 'base'
+    model = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'failures': 0,
+            'latency_total_ms': 0.0,
+            'latency_max_ms': 0.0,
+            'input_tokens': 0,
+            'output_tokens': 0
+        }
+
+    @abstractmethod
+    def _generate(self, prompt: str, publish) -> tuple[str, int, int]:
+        ...
+
+    def generate(self, prompt: str, publish) -> tuple[str, int, int]:
+        started_at = time.monotonic()
+        try:
+            output_text, input_tokens, output_tokens = self._generate(prompt, publish)
+        except Exception:
+            self._record((time.monotonic() - started_at) * 1000, failed=True)
+            raise
+        self._record((time.monotonic() - started_at) * 1000, input_tokens=input_tokens, output_tokens=output_tokens)
+        return output_text, input_tokens, output_tokens
+
+    def _record(self, latency_ms: float, failed: bool = False, input_tokens: int = 0, output_tokens: int = 0):
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['failures'] += int(failed)
+            self._stats['latency_total_ms'] += latency_ms
+            self._stats['latency_max_ms'] = max(self._stats['latency_max_ms'], latency_ms)
+            self._stats['input_tokens'] += input_tokens
+            self._stats['output_tokens'] += output_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['backend'] = self.name
+        stats['model'] = self.model
+        stats['latency_avg_ms'] = round(stats['latency_total_ms'] / stats['calls'], 2) if stats['calls'] else 0.0
+        stats['latency_total_ms'] = round(stats['latency_total_ms'], 2)
+        stats['latency_max_ms'] = round(stats['latency_max_ms'], 2)
+        return stats
+
+# OpenAI Responses API. 클라이언트 하나를 재사용해 HTTP 연결을 유지
+class OpenAIBackend(LLMBackend):
+    name = 'openai'
+
+    def __init__(self, model: str, timeout: float, max_retries: int):
+        super().__init__()
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._client = None
+
+    @property
+    def client(self) -> OpenAI:
+        # API 키가 없는 환경에서도 임포트할 수 있도록 처음 사용할 때 생성
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAI(timeout=self.timeout, max_retries=self.max_retries)
+        return self._client
+
+    def _generate(self, prompt: str, publish) -> tuple[str, int, int]:
+        output_text = ''
+        usage = None
+        events = self.client.responses.create(
+            model=self.model,
+            input=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                },
+            ],
+            stream=True,
+        )
+        for event in events:
+            if event.type == 'response.output_text.delta':
+                output_text += event.delta
+                publish(event.delta)
+            elif event.type == 'response.completed':
+                output_text = event.response.output_text
+                usage = event.response.usage
+            elif event.type in ('response.failed', 'error'):
+                raise RuntimeError(f"응답 생성 실패: {event.type}")
+        if usage is None:
+            raise RuntimeError("응답이 완료되지 않았습니다.")
+        return output_text, usage.input_tokens, usage.output_tokens
+
+# 부하 테스트용 로컬 백엔드. 외부 호출 없이 같은 프롬프트에는 항상 같은 응답을 정해진 시간 동안 나눠서 출력
+class StubBackend(LLMBackend):
+    name = 'stub'
+    model = 'stub'
+
+    def __init__(self, latency: float, chunks: int, input_tokens: int, output_tokens: int):
+        super().__init__()
+        self.latency = latency
+        self.chunks = max(1, chunks)
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+    def _generate(self, prompt: str, publish) -> tuple[str, int, int]:
+        digest = hashlib.sha256(prompt.encode()).hexdigest()
+        deltas = [f"[stub {digest[:8]}] " if index == 0 else f"{digest[index % 56:index % 56 + 8]} " for index in range(self.chunks)]
+        for delta in deltas:
+            time.sleep(self.latency / self.chunks)
+            publish(delta)
+        return ''.join(deltas), self.input_tokens, self.output_tokens
+
+def create_backend(name: str) -> LLMBackend:
+    if name == 'openai':
+        return OpenAIBackend(model=os.environ.get('OPENAI_MODEL', 'gpt-4.1-nano'),
+                             timeout=float(os.environ.get('OPENAI_TIMEOUT', 60)),
+                             max_retries=int(os.environ.get('OPENAI_MAX_RETRIES', 2)))
+    if name == 'stub':
+        return StubBackend(latency=float(os.environ.get('LLM_STUB_LATENCY', 1)),
+                           chunks=int(os.environ.get('LLM_STUB_CHUNKS', 20)),
+                           input_tokens=int(os.environ.get('LLM_STUB_INPUT_TOKENS', 300)),
+                           output_tokens=int(os.environ.get('LLM_STUB_OUTPUT_TOKENS', 200)))
+    raise ValueError(f"지원하지 않는 LLM 백엔드입니다: {name}")
+
+backend = create_backend(os.environ.get('LLM_BACKEND', 'openai'))
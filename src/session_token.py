@@ -0,0 +1,40 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+# 서명된 세션 토큰: base64url(payload).base64url(HMAC-SHA256)
+# payload에 uid, sid, 만료 시각이 포함되어 DB 조회 없이 검증 가능
+def is_enabled() -> bool:
+    return os.environ.get('SESSION_TOKEN_MODE', 'sid') == 'signed'
+
+def is_token(value: str) -> bool:
+    return bool(value) and '.' in value
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(os.environ['SECRET_KEY'].encode(), body.encode(), hashlib.sha256).digest())
+
+def issue(uid: str, sid: str, expires_at: str) -> str:
+    payload = json.dumps({'uid': uid, 'sid': sid, 'exp': expires_at}, separators=(',', ':'))
+    body = _b64encode(payload.encode())
+    return f"{body}.{_sign(body)}"
+
+def verify(token: str) -> dict | None:
+    # 서명이 올바르면 payload, 아니면 None. 만료/폐기 여부는 호출하는 쪽에서 확인
+    try:
+        body, signature = token.split('.', 1)
+        if not hmac.compare_digest(signature, _sign(body)):
+            return None
+        payload = json.loads(_b64decode(body))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or not all(key in payload for key in ('uid', 'sid', 'exp')):
+        return None
+    return payload
\ No newline at end of file
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+class UpstreamUnavailable(Exception):
+    pass
+
+# 외부 API 호출용 클라이언트
+# keep-alive 세션 재사용, 호출별 timeout, 연속 실패 시 일정 시간 호출을 건너뛰는 circuit breaker
+class Upstream:
+    def __init__(self, name: str, timeout: float = 3, verify: bool = True, failure_threshold: int = 5, reset_timeout: float = 30, pool_size: int = 32):
+        self.name = name
+        self.timeout = timeout
+        self.verify = verify
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._stats = {
+            'calls': 0,
+            'failures': 0,
+            'skipped': 0,
+            'latency_total_ms': 0.0,
+            'latency_max_ms': 0.0,
+            'latency_last_ms': 0.0
+        }
+
+    def _allow_request(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # reset_timeout이 지나면 한 번만 시험 호출 허용(half-open)
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial_running:
+                self._trial_running = True
+                return True
+            self._stats['skipped'] += 1
+            return False
+
+    def _record(self, success: bool, latency_ms: float):
+        with self._lock:
+            self._trial_running = False
+            self._stats['calls'] += 1
+            self._stats['latency_total_ms'] += latency_ms
+            self._stats['latency_max_ms'] = max(self._stats['latency_max_ms'], latency_ms)
+            self._stats['latency_last_ms'] = latency_ms
+            if success:
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+            self._stats['failures'] += 1
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def get(self, url: str) -> requests.Response:
+        if not self._allow_request():
+            raise UpstreamUnavailable(f"{self.name} circuit is open")
+
+        started_at = time.monotonic()
+        try:
+            response = self.session.get(url, timeout=self.timeout, verify=self.verify)
+            # 4xx는 정상 응답(데이터 없음 등)으로 보고 호출한 쪽에서 판단
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except requests.RequestException:
+            self._record(False, (time.monotonic() - started_at) * 1000)
+            raise
+        self._record(True, (time.monotonic() - started_at) * 1000)
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = 'closed' if self._opened_at is None else 'open'
+            stats['consecutive_failures'] = self._consecutive_failures
+        stats['latency_avg_ms'] = round(stats['latency_total_ms'] / stats['calls'], 2) if stats['calls'] else 0.0
+        stats['latency_total_ms'] = round(stats['latency_total_ms'], 2)
+        stats['latency_max_ms'] = round(stats['latency_max_ms'], 2)
+        stats['latency_last_ms'] = round(stats['latency_last_ms'], 2)
+        return stats
+
+# 외부 API 병렬 호출용 스레드 풀. 대량 등록 시 (바코드 수 x API 수)만큼 동시에 호출
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('UPSTREAM_MAX_WORKERS', 64)), thread_name_prefix='upstream')
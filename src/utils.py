@@ -3,14 +3,15 @@ import hashlib
 import re
 from datetime import datetime, timedelta
 
-from flask import request
+from flask import Response, request
 
 class ResultDTO:
-    def __init__(self, code: int | bool, message: str, data=None, result: bool = False):
+    def __init__(self, code: int | bool, message: str, data=None, result: bool = False, headers: dict = None):
         self.code = code
         self.message = message
         self.data = data
         self.result = result
+        self.headers = headers
 
     def to_dict(self):
         return {
@@ -25,7 +26,14 @@ class ResultDTO:
             'code': self.code,
             'message': self.message,
             'data': self.data
-        }, self.code
+        }, self.code, self.headers or {}
+
+def to_conditional_response(result: ResultDTO):
+    # ETag가 If-None-Match와 일치하면 본문을 만들지 않고 304 응답
+    etag = (result.headers or {}).get('ETag')
+    if etag and request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers=result.headers)
+    return result.to_response()
 
 def get_client_ip():
     client_ip = request.headers.get("X-Forwarded-For")
@@ -0,0 +1,26 @@
+import importlib.util
+import os
+import unittest
+
+# db 패키지를 임포트하면 db/main.db에 연결하므로 migrations.py만 직접 불러옴
+MIGRATIONS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db', 'migrations.py')
+spec = importlib.util.spec_from_file_location('migrations', MIGRATIONS_PATH)
+migrations = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(migrations)
+
+class QueryPlanTest(unittest.TestCase):
+    def test_all_queries_use_indexes(self):
+        problems = migrations.check_query_plans(os.path.dirname(MIGRATIONS_PATH))
+        self.assertEqual([], [f"{location}: {detail}" for location, sql, detail in problems])
+
+    def test_index_scan_is_full_scan(self):
+        conn = migrations.sqlite3.connect(':memory:')
+        migrations.migrate(conn)
+        tables = {'email_outbox'}
+        # 커버링 인덱스를 처음부터 끝까지 읽는 SCAN도 실패, 인덱스 범위를 좁히는 SEARCH만 통과
+        self.assertTrue(migrations._check_plan(conn, tables, "SELECT status, priority, COUNT(*) FROM email_outbox GROUP BY status, priority"))
+        self.assertEqual([], migrations._check_plan(conn, tables, "SELECT COUNT(*) FROM email_outbox WHERE status = 'queued'"))
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()